@@ -1,11 +1,299 @@
 from puzzle import Puzzle
-import copy
+from grid_symmetry import grid_transforms
+from puzzle_codec import (context_fingerprint, lookup_context, pack,
+                          register_class, register_context, unpack)
+
+# the golden pagoda weight: _SIGMA ** 2 + _SIGMA == 1
+_SIGMA = (5 ** 0.5 - 1) / 2
+# slack for rounding when comparing sums of pagoda weights with 1
+_EPSILON = 1e-9
+
+# (rows, columns, valid cells) -> shared _PegBoard
+_boards = {}
+# (_PegBoard, markers) -> puzzle_codec fingerprint of that context
+_fingerprints = {}
+# puzzle_codec tag of GridPegSolitairePuzzle states
+_TAG = 2
+
+
+class _PegBoard:
+    """
+    Geometry shared by every GridPegSolitairePuzzle on one board.
+
+    Cell (row, column) is bit row * columns + column of an int.  For each
+    jump direction, shift is the distance from the landing cell to the
+    peg jumped over, and mask holds the landing cells with room for that
+    jump, so the landing cells of all jumps in one direction are found
+    with a few shifts and ANDs.
+    """
+
+    def __init__(self, rows, columns, valid):
+        """
+        Create a new _PegBoard self with rows x columns cells, of which
+        the set bits of valid may hold pegs.
+
+        @type self: _PegBoard
+        @type rows: int
+        @type columns: int
+        @type valid: int
+        @rtype: None
+        """
+        self.rows, self.columns, self.valid = rows, columns, valid
+        self.cells = rows * columns
+
+        def mask(accept):
+            # Return the int with the bits of cells (row, col) that pass
+            # accept, and are valid.
+            return sum(1 << (r * columns + c) for r in range(rows)
+                       for c in range(columns) if accept(r, c)) & valid
+
+        # in the order the original list scan tried them: peg coming
+        # from the left, from the right, from above, from below
+        self.jumps = ((-1, mask(lambda r, c: c >= 2)),
+                      (1, mask(lambda r, c: c <= columns - 3)),
+                      (-columns, mask(lambda r, c: r >= 2)),
+                      (columns, mask(lambda r, c: r <= rows - 3)))
+        # row -> {pegs in that row: printed row}, filled in as needed
+        self._row_strings = [{} for _ in range(rows)]
+        # for each rotation or reflection other than the identity that
+        # keeps the valid cells in place, the cell each cell is sent to
+        self._symmetries = []
+        for transform in grid_transforms(rows, columns)[1:]:
+            destination = [0] * self.cells
+            for (i, source) in enumerate(transform):
+                destination[source] = i
+            if self._move_bits(destination, valid) == valid:
+                self._symmetries.append(destination)
+        # per symmetry, row -> {pegs in that row: transformed pegs}
+        self._row_images = [[{} for _ in range(rows)]
+                            for _ in self._symmetries]
+        cells = [i for i in range(self.cells) if valid >> i & 1]
+        # weights[t][i] is _SIGMA to the distance from cell i to cell t:
+        # a pagoda function, since no jump raises the total weight of
+        # the pegs, and a peg can only reach t if that total is >= 1
+        self.weights = [[0.0] * self.cells for _ in range(self.cells)]
+        for t in cells:
+            for i in cells:
+                distance = (abs(i // columns - t // columns) +
+                            abs(i % columns - t % columns))
+                self.weights[t][i] = _SIGMA ** distance
+        # valid orthogonal neighbours of each cell
+        self.neighbours = [[t for t in cells if
+                            abs(i // columns - t // columns) +
+                            abs(i % columns - t % columns) == 1]
+                           for i in range(self.cells)]
+        # offsets of the other cells within distance 2, each with the
+        # mask of cells the offset stays on the board from
+        self.nearby = []
+        for dr in range(-2, 3):
+            for dc in range(-2, 3):
+                if 0 < abs(dr) + abs(dc) <= 2:
+                    self.nearby.append((dr * columns + dc, mask(
+                        lambda r, c, dr=dr, dc=dc: 0 <= r + dr < rows and
+                        0 <= c + dc < columns)))
+        # Conway's position classes: the cells of each diagonal colouring
+        # modulo 3.  Every jump covers one cell of each colour, so it flips
+        # the parity of the pegs in every class at once.
+        self.classes = [[mask(lambda r, c, k=k: (r + c) % 3 == k)
+                         for k in range(3)],
+                        [mask(lambda r, c, k=k: (r - c) % 3 == k)
+                         for k in range(3)]]
+        # signature -> cells where the last peg may end up
+        self._targets = {}
+
+    @staticmethod
+    def _move_bits(destination, bits):
+        # Return bits with each bit i moved to bit destination[i].
+        #
+        # @type destination: list[int]
+        # @type bits: int
+        # @rtype: int
+        result = 0
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            result |= 1 << destination[bit.bit_length() - 1]
+        return result
+
+    def canonical(self, pegs):
+        """
+        Return the least of pegs and its images under the symmetries of
+        the board, so that symmetric positions get the same key.
+
+        @type self: _PegBoard
+        @type pegs: int
+        @rtype: int
+        """
+        least, row_mask = pegs, (1 << self.columns) - 1
+        for (destination, images) in zip(self._symmetries, self._row_images):
+            image = 0
+            for row in range(self.rows):
+                row_pegs = (pegs >> (row * self.columns)) & row_mask
+                if row_pegs not in images[row]:
+                    images[row][row_pegs] = self._move_bits(
+                        destination, row_pegs << (row * self.columns))
+                image |= images[row][row_pegs]
+            if image < least:
+                least = image
+        return least
+
+    def row_string(self, row, pegs):
+        """
+        Return row of a board with pegs printed with "#" for unused,
+        "*" for peg, and "." for empty.
+
+        @type self: _PegBoard
+        @type row: int
+        @type pegs: int
+        @rtype: str
+        """
+        row_pegs = (pegs >> (row * self.columns)) & ((1 << self.columns) - 1)
+        strings = self._row_strings[row]
+        if row_pegs not in strings:
+            line = []
+            for column in range(self.columns):
+                bit = 1 << (row * self.columns + column)
+                if pegs & bit:
+                    line.append("*")
+                elif self.valid & bit:
+                    line.append(".")
+                else:
+                    line.append("#")
+            strings[row_pegs] = "".join(line)
+        return strings[row_pegs]
+
+    def signature(self, pegs):
+        """
+        Return the position class of pegs, which no jump changes.
+
+        @type self: _PegBoard
+        @type pegs: int
+        @rtype: tuple[int]
+        """
+        signature = []
+        for colouring in self.classes:
+            counts = [bin(pegs & mask).count("1") for mask in colouring]
+            signature += [(counts[0] + counts[1]) % 2,
+                          (counts[1] + counts[2]) % 2]
+        return tuple(signature)
+
+    def targets(self, signature):
+        """
+        Return the pagoda weights towards each cell where a single peg has
+        position class signature, which are the only cells where the last
+        peg of a board with that signature can finish.
+
+        @type self: _PegBoard
+        @type signature: tuple[int]
+        @rtype: tuple[list[float]]
+        """
+        if signature not in self._targets:
+            self._targets[signature] = tuple(
+                [self.weights[i] for i in range(self.cells)
+                 if self.valid >> i & 1 and
+                 self.signature(1 << i) == signature])
+        return self._targets[signature]
+
+    def isolated(self, pegs):
+        """
+        Return whether some peg in pegs can never take part in a jump,
+        while other pegs remain.
+
+        A peg only jumps or is jumped with another peg next to it.  Until
+        then the other pegs move on their own, so by the pagoda argument
+        a peg can only reach a neighbour t if their total weight towards
+        t is at least 1.
+
+        @type self: _PegBoard
+        @type pegs: int
+        @rtype: bool
+        """
+        if pegs & (pegs - 1) == 0:
+            return False
+        # pegs with another peg within distance 2 are not worth checking
+        crowded = 0
+        for (shift, mask) in self.nearby:
+            if shift > 0:
+                crowded |= (pegs & mask) << shift
+            else:
+                crowded |= (pegs & mask) >> -shift
+        remaining = pegs & ~crowded
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            i = bit.bit_length() - 1
+            others = pegs ^ bit
+            if not any([self._reaches(self.weights[t], others)
+                        for t in self.neighbours[i]]):
+                return True
+        return False
+
+    @staticmethod
+    def _reaches(weights, pegs):
+        # Return whether the total of weights over the cells of pegs is
+        # at least 1, stopping as soon as it is.
+        #
+        # @type weights: list[float]
+        # @type pegs: int
+        # @rtype: bool
+        total = 0.0
+        while pegs:
+            bit = pegs & -pegs
+            pegs ^= bit
+            total += weights[bit.bit_length() - 1]
+            if total >= 1 - _EPSILON:
+                return True
+        return False
+
+    @staticmethod
+    def _weight(weights, pegs):
+        # Return the total of weights over the cells of pegs.
+        #
+        # @type weights: list[float]
+        # @type pegs: int
+        # @rtype: float
+        total = 0.0
+        while pegs:
+            bit = pegs & -pegs
+            pegs ^= bit
+            total += weights[bit.bit_length() - 1]
+        return total
+
+
+def _peg_board(rows, columns, valid):
+    # Return the shared _PegBoard for this geometry.
+    #
+    # @type rows: int
+    # @type columns: int
+    # @type valid: int
+    # @rtype: _PegBoard
+    key = (rows, columns, valid)
+    if key not in _boards:
+        _boards[key] = _PegBoard(rows, columns, valid)
+    return _boards[key]
+
+
+def _unpickle_puzzle(rows, columns, valid, pegs, marker_set):
+    # Return the GridPegSolitairePuzzle pickled by __reduce__.
+    #
+    # @type rows: int
+    # @type columns: int
+    # @type valid: int
+    # @type pegs: int
+    # @type marker_set: set[str]
+    # @rtype: GridPegSolitairePuzzle
+    puzzle = GridPegSolitairePuzzle.__new__(GridPegSolitairePuzzle)
+    puzzle._set_pegs(_peg_board(rows, columns, valid), pegs, marker_set)
+    return puzzle
 
 
 class GridPegSolitairePuzzle(Puzzle):
     """
     Snapshot of peg solitaire on a rectangular grid. May be solved,
     unsolved, or even unsolvable.
+
+    The board is stored as bitboards: an int of pegs, together with a
+    shared _PegBoard giving the valid cells, and the number of pegs.
     """
 
     def __init__(self, marker, marker_set):
@@ -23,7 +311,125 @@ class GridPegSolitairePuzzle(Puzzle):
         assert all([len(x) == len(marker[0]) for x in marker[1:]])
         assert all([all(x in marker_set for x in row) for row in marker])
         assert all([x == "*" or x == "." or x == "#" for x in marker_set])
-        self._marker, self._marker_set = marker, marker_set
+        rows, columns = len(marker), len(marker[0])
+        pegs = valid = 0
+        for row in range(rows):
+            for column in range(columns):
+                bit = 1 << (row * columns + column)
+                if marker[row][column] != "#":
+                    valid |= bit
+                if marker[row][column] == "*":
+                    pegs |= bit
+        self._set_pegs(_peg_board(rows, columns, valid), pegs, marker_set)
+
+    def _set_pegs(self, board, pegs, marker_set):
+        # Set GridPegSolitairePuzzle self to hold pegs on board.
+        #
+        # @type self: GridPegSolitairePuzzle
+        # @type board: _PegBoard
+        # @type pegs: int
+        # @type marker_set: set[str]
+        # @rtype: None
+        self._board, self._marker_set = board, marker_set
+        self._pegs, self._count = pegs, bin(pegs).count("1")
+        # where the last peg may finish, and the pagoda weight of the pegs
+        # towards each of those cells; both are updated move by move
+        self._targets = board.targets(board.signature(pegs))
+        self._pagoda = tuple([board._weight(weights, pegs)
+                              for weights in self._targets])
+
+    def __reduce__(self):
+        """
+        Return how to pickle GridPegSolitairePuzzle self: only its pegs
+        and board shape, since everything else can be recomputed.
+
+        @type self: GridPegSolitairePuzzle
+        @rtype: tuple
+
+        >>> import pickle
+        >>> g = GridPegSolitairePuzzle([["*", "*", "."]], {"*", ".", "#"})
+        >>> pickle.loads(pickle.dumps(g)) == g
+        True
+        """
+        return _unpickle_puzzle, (self._board.rows, self._board.columns,
+                                  self._board.valid, self._pegs,
+                                  self._marker_set)
+
+    def to_bytes(self):
+        """
+        Return a compact encoding of GridPegSolitairePuzzle self: one bit
+        per cell for its pegs, with its board and markers referred to by
+        fingerprint.
+
+        @type self: GridPegSolitairePuzzle
+        @rtype: bytes
+
+        >>> grid = [["*", "*", "*"], ["*", ".", "*"], ["#", "*", "#"]]
+        >>> g = GridPegSolitairePuzzle(grid, {"*", ".", "#"})
+        >>> len(g.to_bytes())
+        12
+        >>> GridPegSolitairePuzzle.from_bytes(g.to_bytes()) == g
+        True
+        """
+        board = self._board
+        key = (board, frozenset(self._marker_set))
+        if key not in _fingerprints:
+            markers = tuple(sorted(self._marker_set))
+            _fingerprints[key] = context_fingerprint(
+                "peg", board.rows, board.columns, board.valid, markers)
+            register_context(_fingerprints[key],
+                             (board.rows, board.columns, board.valid, markers))
+        return pack(_TAG, _fingerprints[key],
+                    self._pegs.to_bytes((board.cells + 7) // 8, "little"))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Return the GridPegSolitairePuzzle encoded in data by to_bytes.
+
+        @type cls: type
+        @type data: bytes
+        @rtype: GridPegSolitairePuzzle
+        """
+        (fingerprint, payload) = unpack(data, _TAG)
+        (rows, columns, valid, markers) = lookup_context(fingerprint)
+        return _unpickle_puzzle(rows, columns, valid,
+                                int.from_bytes(payload, "little"),
+                                set(markers))
+
+    @classmethod
+    def _from_bits(cls, board, pegs, count, marker_set, targets, pagoda):
+        # Return a new GridPegSolitairePuzzle on board with pegs, holding
+        # count pegs, without scanning a marker grid.
+        #
+        # @type board: _PegBoard
+        # @type pegs: int
+        # @type count: int
+        # @type marker_set: set[str]
+        # @type targets: tuple[list[float]]
+        # @type pagoda: tuple[float]
+        # @rtype: GridPegSolitairePuzzle
+        puzzle = cls.__new__(cls)
+        puzzle._board, puzzle._marker_set = board, marker_set
+        puzzle._pegs, puzzle._count = pegs, count
+        puzzle._targets, puzzle._pagoda = targets, pagoda
+        return puzzle
+
+    @property
+    def _marker(self):
+        """
+        Return the board of GridPegSolitairePuzzle self as a new grid of
+        "#" for unused, "*" for peg, and "." for empty.
+
+        @type self: GridPegSolitairePuzzle
+        @rtype: list[list[str]]
+
+        >>> g = GridPegSolitairePuzzle([["#", "*", "."]], {"*", ".", "#"})
+        >>> g._marker
+        [['#', '*', '.']]
+        """
+        return [list(self._board.row_string(row, self._pegs))
+                for row in range(self._board.rows)]
 
     def __eq__(self, other):
         """
@@ -52,7 +458,33 @@ class GridPegSolitairePuzzle(Puzzle):
         >>> g1 == g3
         False
         """
-        return type(self) == type(other) and self._marker == other._marker and self._marker_set == other._marker_set
+        return (type(self) == type(other) and self._pegs == other._pegs and
+                self._board is other._board and
+                self._marker_set == other._marker_set)
+
+    def __hash__(self):
+        """
+        Return a hash of GridPegSolitairePuzzle self.
+
+        @type self: GridPegSolitairePuzzle
+        @rtype: int
+        """
+        return hash((self._pegs, self._board.valid, self._board.columns))
+
+    def canonical_key(self):
+        """
+        Return a key shared by GridPegSolitairePuzzle self and its
+        rotations and reflections that fit the same board.
+
+        @type self: GridPegSolitairePuzzle
+        @rtype: int
+
+        >>> g1 = GridPegSolitairePuzzle([["*", "*", "."]], {"*", ".", "#"})
+        >>> g2 = GridPegSolitairePuzzle([[".", "*", "*"]], {"*", ".", "#"})
+        >>> g1.canonical_key() == g2.canonical_key()
+        True
+        """
+        return self._board.canonical(self._pegs)
 
     def __str__(self):
         """
@@ -74,7 +506,8 @@ class GridPegSolitairePuzzle(Puzzle):
         **.**
         #***#
         """
-        return "\n".join(["".join(item) for item in self._marker])
+        return "\n".join([self._board.row_string(row, self._pegs)
+                          for row in range(self._board.rows)])
 
 
     # TODO
@@ -98,50 +531,42 @@ class GridPegSolitairePuzzle(Puzzle):
         >>> grid1[2][1] = "."
         >>> grid1[2][2] = "*"
         >>> g2 = GridPegSolitairePuzzle(grid1, {"*", ".", "#"})
-        >>> len(g1._marker) == len(g2._marker)
-        True
-        >>> all([s in g1._marker for s in g2._marker])
-        True
-        >>> all([s in g2._marker for s in g1._marker])
+        >>> newlist == [g2]
         True
         """
         # convenient names
-        marker, marker_set = self._marker, self._marker_set
-        new_list = []
+        board, pegs = self._board, self._pegs
         if self.is_solved():
             return [_ for _ in []]
-        else:
-            for row in range(len(marker)):
-                for item in range(len(marker[row])):
-                    if marker[row][item] == ".":
-                        if item >= 2 and marker[row][item - 1] == "*" and marker[row][item - 2] == "*":
-                            new_marker = copy.deepcopy(self._marker)
-                            new_marker[row][item] = "*"
-                            new_marker[row][item - 1] = "."
-                            new_marker[row][item - 2] = "."
-                            new_list.append(GridPegSolitairePuzzle(new_marker,self._marker_set))
-                        if item <= len(marker[row]) - 3 and marker[row][item + 1] == "*" and \
-                           marker[row][item + 2] == "*":
-                            new_marker = copy.deepcopy(self._marker)
-                            new_marker[row][item] = "*"
-                            new_marker[row][item + 1] = "."
-                            new_marker[row][item + 2] = "."
-                            new_list.append(GridPegSolitairePuzzle(new_marker,self._marker_set))
-                        if row >= 2 and marker[row - 1][item] == "*" and marker[row - 2][item] == "*":
-                            new_marker = copy.deepcopy(self._marker)
-                            new_marker[row][item] = "*"
-                            new_marker[row - 1][item] = "."
-                            new_marker[row - 2][item] = "."
-                            new_list.append(GridPegSolitairePuzzle(new_marker,self._marker_set))
-                        if row <= len(marker) - 3 and marker[row + 1][item] == "*" and marker[row + 2][item] == "*":
-                            new_marker = copy.deepcopy(self._marker)
-                            new_marker[row][item] = "*"
-                            new_marker[row + 1][item] = "."
-                            new_marker[row + 2][item] = "."
-                            new_list.append(GridPegSolitairePuzzle(new_marker,self._marker_set))
-                    else:
-                        pass
-            return new_list
+        empty = board.valid & ~pegs
+        # landing cells of the jumps in each direction: empty, with a peg
+        # to jump over at distance shift and a jumping peg beyond it
+        landings = []
+        for (shift, mask) in board.jumps:
+            if shift > 0:
+                over, start = pegs >> shift, pegs >> 2 * shift
+            else:
+                over, start = pegs << -shift, pegs << -2 * shift
+            landings.append(empty & mask & over & start)
+        new_list = []
+        remaining = landings[0] | landings[1] | landings[2] | landings[3]
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            for direction in range(4):
+                if landings[direction] & bit:
+                    shift = board.jumps[direction][0]
+                    to = bit.bit_length() - 1
+                    (over, start) = (to + shift, to + 2 * shift)
+                    moved = bit | 1 << over | 1 << start
+                    pagoda = tuple([
+                        value + weights[to] - weights[over] - weights[start]
+                        for (value, weights) in zip(self._pagoda,
+                                                    self._targets)])
+                    new_list.append(GridPegSolitairePuzzle._from_bits(
+                        board, pegs ^ moved, self._count - 1,
+                        self._marker_set, self._targets, pagoda))
+        return new_list
 
     # TODO
     # override extensions
@@ -163,13 +588,54 @@ class GridPegSolitairePuzzle(Puzzle):
         >>> g1.is_solved()
         True
         """
-        gather = []
-        for row in self._marker:
-            gather += row
-        return gather.count("*") == 1
+        return self._count == 1
     # TODO
     # override is_solved
     # A configuration is solved when there is exactly one "*" left
+    def heuristic(self):
+        """
+        Return the number of jumps left to solve GridPegSolitairePuzzle
+        self, if it can be: each jump removes one peg.
+
+        @type self: GridPegSolitairePuzzle
+        @rtype: int
+
+        >>> grid = [["*", "*", ".", "*"]]
+        >>> GridPegSolitairePuzzle(grid, {"*", ".", "#"}).heuristic()
+        2
+        """
+        return max(self._count - 1, 0)
+
+    def fail_fast(self):
+        """
+        Return True if GridPegSolitairePuzzle self provably can't be
+        reduced to a single peg: no cell can hold the last peg given the
+        position class of self, the pagoda weight of the pegs towards
+        every such cell is below 1, or some peg can never be reached by
+        the others.
+
+        @type self: GridPegSolitairePuzzle
+        @rtype: bool
+
+        >>> grid1 = [["*", "*", "*", "*"] for _ in range(4)]
+        >>> grid1[1][1] = "."
+        >>> GridPegSolitairePuzzle(grid1, {"*", ".", "#"}).fail_fast()
+        True
+        >>> grid2 = [["*", ".", ".", ".", "*"]]
+        >>> GridPegSolitairePuzzle(grid2, {"*", ".", "#"}).fail_fast()
+        True
+        >>> grid3 = [["*", "*", ".", "."]]
+        >>> GridPegSolitairePuzzle(grid3, {"*", ".", "#"}).fail_fast()
+        False
+        """
+        if self._count == 0 or not self._targets:
+            return True
+        if all([value < 1 - _EPSILON for value in self._pagoda]):
+            return True
+        return self._board.isolated(self._pegs)
+
+
+register_class(_TAG, GridPegSolitairePuzzle)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+"""
+Symmetries of rectangular grids, used to recognise puzzle states that
+are rotations or reflections of states a solver has already seen.
+"""
+
+
+def grid_transforms(rows, columns):
+    """
+    Return the rotations and reflections that map a rows x columns grid
+    onto itself, identity first.
+
+    Each transform is a tuple p of cell indices (row * columns + column):
+    the transformed grid holds the symbol of cell p[i] at cell i.  A
+    square grid has all eight symmetries of the square, any other grid
+    only the four that keep its shape.
+
+    @type rows: int
+    @type columns: int
+    @rtype: list[tuple[int]]
+
+    >>> grid_transforms(1, 2)
+    [(0, 1), (1, 0)]
+    >>> len(grid_transforms(3, 3)), len(grid_transforms(2, 3))
+    (8, 4)
+    """
+    r, c = rows - 1, columns - 1
+    # each map sends the cell at (row, column) to a new (row, column)
+    maps = [lambda i, j: (i, j), lambda i, j: (r - i, j),
+            lambda i, j: (i, c - j), lambda i, j: (r - i, c - j)]
+    if rows == columns:
+        maps += [lambda i, j: (j, i), lambda i, j: (c - j, r - i),
+                 lambda i, j: (j, r - i), lambda i, j: (c - j, i)]
+    transforms = []
+    for f in maps:
+        p = [0] * (rows * columns)
+        for i in range(rows):
+            for j in range(columns):
+                (new_i, new_j) = f(i, j)
+                p[new_i * columns + new_j] = i * columns + j
+        if tuple(p) not in transforms:
+            transforms.append(tuple(p))
+    return transforms
+
+
+def apply_transform(transform, cells):
+    """
+    Return cells, a flattened grid, rearranged by transform.
+
+    @type transform: tuple[int]
+    @type cells: list | tuple
+    @rtype: tuple
+
+    >>> apply_transform(grid_transforms(2, 2)[4], "abcd")
+    ('a', 'c', 'b', 'd')
+    """
+    return tuple([cells[i] for i in transform])
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,4 +1,42 @@
 from puzzle import Puzzle
+from grid_symmetry import apply_transform, grid_transforms
+from puzzle_codec import (context_fingerprint, lookup_context, pack,
+                          register_class, register_context, unpack)
+
+# to_grid -> list of (transform, relabelling) that fix to_grid
+_goal_symmetries = {}
+# to_grid -> (puzzle_codec fingerprint, {symbol: its cell in to_grid})
+_goal_codes = {}
+# to_grid -> {symbol: the (row, column) cells of symbol in to_grid}
+_goal_cells = {}
+# puzzle_codec tag of MNPuzzle states
+_TAG = 3
+
+
+def _symmetries_of(to_grid):
+    # Return the rotations and reflections of to_grid, other than the
+    # identity, that keep "*" in place, each with the relabelling of
+    # symbols that turns the rotated or reflected to_grid back into
+    # to_grid.
+    #
+    # @type to_grid: tuple[tuple[str]]
+    # @rtype: list[(tuple[int], dict[str, str])]
+    if to_grid not in _goal_symmetries:
+        goal = [symbol for row in to_grid for symbol in row]
+        symmetries = []
+        for transform in grid_transforms(len(to_grid), len(to_grid[0]))[1:]:
+            relabel = {}
+            for (symbol, target) in zip(apply_transform(transform, goal),
+                                        goal):
+                if relabel.setdefault(symbol, target) != target:
+                    break
+            else:
+                if (relabel.get("*") == "*" and
+                        len(set(relabel.values())) == len(relabel)):
+                    symmetries.append((transform, relabel))
+        _goal_symmetries[to_grid] = symmetries
+    return _goal_symmetries[to_grid]
+
 
 
 class MNPuzzle(Puzzle):
@@ -36,6 +74,64 @@ class MNPuzzle(Puzzle):
                                                                                                 other.to_grid, other.n,
                                                                                                 other.m)
 
+    def canonical_key(self):
+        """
+        Return a key shared by MNPuzzle self and the rotations and
+        reflections of it that, after renaming symbols, have the same
+        to_grid: they are the same distance from being solved.
+
+        @type self: MNPuzzle
+        @rtype: tuple
+
+        >>> goal = (("1", "2"), ("3", "*"))
+        >>> m1 = MNPuzzle((("2", "*"), ("1", "3")), goal)
+        >>> m2 = MNPuzzle((("3", "1"), ("*", "2")), goal)
+        >>> m1.canonical_key() == m2.canonical_key()
+        True
+        >>> m1.canonical_key() == MNPuzzle((("1", "*"), ("2", "3")), goal).canonical_key()
+        False
+        """
+        symmetries = _symmetries_of(self.to_grid)
+        if not symmetries:
+            return self.from_grid
+        cells = [symbol for row in self.from_grid for symbol in row]
+        least = tuple(cells)
+        for (transform, relabel) in symmetries:
+            image = tuple([relabel.get(cells[i], cells[i]) for i in transform])
+            if image < least:
+                least = image
+        return least
+
+    def heuristic(self):
+        """
+        Return the sum, over the symbols of MNPuzzle self other than "*",
+        of the rows and columns between each and the nearest cell of
+        to_grid holding it: every move takes one symbol one cell closer.
+
+        @type self: MNPuzzle
+        @rtype: int
+
+        >>> goal = (("1", "2", "3"), ("4", "5", "*"))
+        >>> MNPuzzle((("*", "2", "3"), ("1", "4", "5")), goal).heuristic()
+        3
+        >>> MNPuzzle(goal, goal).heuristic()
+        0
+        """
+        if self.to_grid not in _goal_cells:
+            cells = {}
+            for (r, row) in enumerate(self.to_grid):
+                for (c, symbol) in enumerate(row):
+                    cells.setdefault(symbol, []).append((r, c))
+            _goal_cells[self.to_grid] = cells
+        cells = _goal_cells[self.to_grid]
+        total = 0
+        for (r, row) in enumerate(self.from_grid):
+            for (c, symbol) in enumerate(row):
+                if symbol != "*":
+                    total += min([abs(r - r2) + abs(c - c2)
+                                  for (r2, c2) in cells[symbol]])
+        return total
+
     def __str__(self):
         """
         Return a string representation of self
@@ -51,6 +147,51 @@ class MNPuzzle(Puzzle):
         """
         return "\n".join(["".join(lines) for lines in self.from_grid])
 
+    def to_bytes(self):
+        """
+        Return a compact encoding of MNPuzzle self: for each cell of
+        from_grid, the cell of to_grid holding the same symbol, with
+        to_grid referred to by fingerprint.  Grids may have up to 256
+        cells.
+
+        @type self: MNPuzzle
+        @rtype: bytes
+
+        >>> goal = (("1", "2", "3"), ("4", "5", "*"))
+        >>> m = MNPuzzle((("*", "2", "3"), ("1", "4", "5")), goal)
+        >>> len(m.to_bytes())
+        16
+        >>> MNPuzzle.from_bytes(m.to_bytes()) == m
+        True
+        """
+        if self.to_grid not in _goal_codes:
+            fingerprint = context_fingerprint("mn", self.to_grid)
+            register_context(fingerprint, self.to_grid)
+            cells = {}
+            for (i, symbol) in enumerate(
+                    [symbol for row in self.to_grid for symbol in row]):
+                cells.setdefault(symbol, i)
+            _goal_codes[self.to_grid] = (fingerprint, cells)
+        (fingerprint, cells) = _goal_codes[self.to_grid]
+        return pack(_TAG, fingerprint, bytes(
+            [cells[symbol] for row in self.from_grid for symbol in row]))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Return the MNPuzzle encoded in data by to_bytes.
+
+        @type cls: type
+        @type data: bytes
+        @rtype: MNPuzzle
+        """
+        (fingerprint, payload) = unpack(data, _TAG)
+        to_grid = lookup_context(fingerprint)
+        goal = [symbol for row in to_grid for symbol in row]
+        m = len(to_grid[0])
+        return cls(tuple([tuple([goal[i] for i in payload[r:r + m]])
+                          for r in range(0, len(payload), m)]), to_grid)
+
     # TODO
     # implement __eq__ and __str__  check!
     # __repr__ is up to you
@@ -145,6 +286,9 @@ class MNPuzzle(Puzzle):
     # a configuration is solved when from_grid is the same as to_grid
 
 
+register_class(_TAG, MNPuzzle)
+
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
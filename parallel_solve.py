@@ -0,0 +1,322 @@
+"""
+Depth-first search spread over a pool of processes.
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import multiprocessing
+import os
+import time
+from puzzle_codec import add_contexts, contexts, decode, encode
+from puzzle_tools import create_puzzlenode, PuzzleNode
+
+# set in each worker process: signals that some worker found a solution
+_cancelled = None
+# set in each worker process: the contexts of the states it is sent,
+# kept alive here since puzzle_codec only refers to some of them weakly
+_contexts = None
+# most unexplored branches a split hands back as puzzles; the others are
+# handed back as places among their parents' extensions
+_MAX_BRANCHES = 8
+# most canonical keys the coordinator keeps to drop repeated subtrees
+_MAX_SEEN = 1000000
+
+
+def _init_worker(event, shared):
+    # Remember the pool's cancellation event in this worker process, and
+    # register the contexts shared, from puzzle_codec.contexts().
+    #
+    # @type event: multiprocessing.Event
+    # @type shared: dict[int, object]
+    # @rtype: None
+    global _cancelled, _contexts
+    _cancelled, _contexts = event, shared
+    add_contexts(shared)
+
+
+def _explore(start, budget):
+    # Search depth-first below start, visiting at most budget puzzles.
+    #
+    # Return one of
+    #   ("solved", puzzles from start to a solution, None),
+    #   ("exhausted", None, keys) if there is no solution below start,
+    #   ("split", (stack, branches, rest), keys) if the budget ran out
+    #       or another worker found a solution first,
+    # where stack holds the puzzles from start to the last one expanded,
+    # branches holds (i, puzzle) for the first _MAX_BRANCHES unexplored
+    # extension puzzles of stack[i], rest holds (i, j) where the
+    # extensions of stack[i] from index j on are unexplored as well, and
+    # keys are the canonical keys of the puzzles visited.
+    #
+    # @type start: Puzzle
+    # @type budget: int
+    # @rtype: (str, list[Puzzle] | tuple | None, set | None)
+    seen = set([start.canonical_key()])
+    if start.fail_fast():
+        return "exhausted", None, seen
+    if start.is_solved():
+        return "solved", [start], None
+    # [puzzle, its extensions, index of the next one to try], start first
+    stack, visited = [[start, list(start.extensions()), 0]], 1
+    while stack:
+        if visited >= budget or (
+                visited % 256 == 0 and _cancelled is not None and
+                _cancelled.is_set()):
+            return "split", _split(stack), seen
+        entry = stack[-1]
+        (_, children, i) = entry
+        if i == len(children):
+            stack.pop()
+            continue
+        entry[2] = i + 1
+        child = children[i]
+        key = child.canonical_key()
+        if key in seen:
+            continue
+        seen.add(key)
+        visited += 1
+        if child.fail_fast():
+            continue
+        if child.is_solved():
+            return "solved", [p for (p, _, _) in stack] + [child], None
+        stack.append([child, list(child.extensions()), 0])
+    return "exhausted", None, seen
+
+
+def _split(stack):
+    # Return (puzzles, branches, rest) for the unexplored work left on
+    # the stack of _explore, as described there.
+    #
+    # @type stack: list[list]
+    # @rtype: (list[Puzzle], list[(int, Puzzle)], list[(int, int)])
+    branches, rest = [], []
+    for (i, (_, children, j)) in enumerate(stack):
+        taken = children[j:j + _MAX_BRANCHES - len(branches)]
+        branches.extend([(i, child) for child in taken])
+        if j + len(taken) < len(children):
+            rest.append((i, j + len(taken)))
+    return [p for (p, _, _) in stack], branches, rest
+
+
+def _explore_encoded(data, budget):
+    # Return _explore(start, budget) for the puzzle start encoded in data
+    # by puzzle_codec.encode, with the puzzles in its result encoded too.
+    #
+    # @type data: bytes
+    # @type budget: int
+    # @rtype: (str, list[bytes] | tuple | None, set | None)
+    (status, result, seen) = _explore(decode(data), budget)
+    if status == "solved":
+        result = [encode(p) for p in result]
+    elif status == "split":
+        (stack, branches, rest) = result
+        result = ([encode(p) for p in stack],
+                  [(i, encode(child)) for (i, child) in branches], rest)
+    return status, result, seen
+
+
+def _decoded(status, result):
+    # Return the result of _explore_encoded with status, with its puzzles
+    # decoded, as _explore returns it.
+    #
+    # @type status: str
+    # @type result: list[bytes] | tuple | None
+    # @rtype: list[Puzzle] | tuple | None
+    if status == "solved":
+        return [decode(data) for data in result]
+    if status == "split":
+        (stack, branches, rest) = result
+        return ([decode(data) for data in stack],
+                [(i, decode(data)) for (i, data) in branches], rest)
+    return result
+
+
+def _path_to_node(link, puzzles):
+    # Return the PuzzleNode path from the root of the search through the
+    # prefix at link and then through puzzles, as depth_first_solve would.
+    #
+    # A link is None at the root, or (segment, i) for the puzzle at
+    # index i of a segment (puzzles, link) of the path.
+    #
+    # @type link: (tuple, int) | None
+    # @type puzzles: list[Puzzle]
+    # @rtype: PuzzleNode
+    prefix = []
+    while link is not None:
+        ((segment, segment_link), i) = link
+        prefix.extend(reversed(segment[:i + 1]))
+        link = segment_link
+    puzzles = prefix[::-1] + puzzles
+    node = PuzzleNode(puzzles[-1])
+    for puzzle in reversed(puzzles[:-1]):
+        node = create_puzzlenode(puzzle, node)
+    return node
+
+
+def parallel_depth_first_solve(puzzle, workers=None, budget=20000,
+                               timeout=None):
+    """
+    Return a path from PuzzleNode(puzzle) to a PuzzleNode containing
+    a solution, with each child containing an extension of the puzzle
+    in its parent, as depth_first_solve does.  Return None if this is
+    not possible.
+
+    The top of the search tree is split into subtrees that are searched
+    by workers processes (all cores by default).  A subtree that takes
+    more than budget puzzles is split again into its unexplored
+    branches, so idle workers pick up work from busy ones, and the first
+    solution found stops all the others.  A split sends back at most
+    _MAX_BRANCHES branches as puzzles, and the others only as their
+    places among their parents' extensions, which are made again here
+    when they are reached, so extensions must return the same list every
+    time it is called on equal puzzles.
+
+    An exception raised by a task, such as a puzzle that cannot be
+    pickled, stops every worker and is raised again here, and so does
+    TimeoutError if timeout is not None and no solution was found
+    within timeout seconds.
+
+    Workers report the puzzles they visited, and subtrees rooted at a
+    puzzle that was already visited are dropped, but within a subtree
+    each worker only knows its own seen set, so a puzzle may still be
+    visited by more than one worker.  Workers report at most budget
+    puzzles per task, and at most _MAX_SEEN are kept here.
+
+    Puzzles go to and from workers encoded with puzzle_codec.encode,
+    and the contexts they share, such as a word set, are sent to each
+    worker once, when it starts.  Each task then costs about 0.25ms of
+    process round trip for a 5x5 GridPegSolitairePuzzle or for a
+    WordLadderPuzzle on a full word list, and more for puzzles that do
+    not implement to_bytes and are pickled whole, so budget should keep
+    tasks well above that.  How the search
+    scales with many workers has not been measured: workers may repeat
+    each other's work, and the order subtrees are searched in differs
+    from depth_first_solve, so a parallel search may take longer, and
+    find a longer path, than a serial one.
+
+    @type puzzle: Puzzle
+    @type workers: int | None
+    @type budget: int
+    @type timeout: float | None
+    @rtype: PuzzleNode | None
+
+    >>> from grid_peg_solitaire_puzzle import GridPegSolitairePuzzle
+    >>> grid = [["*", "*", ".", "*", "*"]]
+    >>> g = GridPegSolitairePuzzle(grid, {"*", ".", "#"})
+    >>> parallel_depth_first_solve(g, workers=2) is None
+    True
+    >>> grid = [["*", "*", ".", "*"]]
+    >>> g = GridPegSolitairePuzzle(grid, {"*", ".", "#"})
+    >>> node = parallel_depth_first_solve(g, workers=2)
+    >>> while node.children:
+    ...     node = node.children[0]
+    >>> node.puzzle.is_solved()
+    True
+    >>> grid = [["*"] * 5 for _ in range(5)]
+    >>> grid[3][2] = "."
+    >>> g = GridPegSolitairePuzzle(grid, {"*", ".", "#"})
+    >>> parallel_depth_first_solve(g, workers=2, timeout=0)
+    Traceback (most recent call last):
+    ...
+    TimeoutError: no solution found in 0 seconds
+    """
+    workers = workers or os.cpu_count() or 1
+    deadline = None if timeout is None else time.monotonic() + timeout
+    # expand the top of the tree until there is work for every worker
+    (status, result, seen) = _explore(puzzle, 4 * workers)
+    if status == "solved":
+        return _path_to_node(None, result)
+    if status == "exhausted":
+        return None
+    # (puzzle, None, link to its parent) of each subtree still to
+    # search, or (puzzle, j, link to puzzle) for the subtrees of the
+    # extensions of puzzle from index j on, which are only made again
+    # when they reach the front
+    tasks = deque()
+
+    def add_branches(link, split):
+        # Queue the unexplored branches of split, which was found below
+        # the puzzle at link, ahead of the older tasks.
+        (stack, branches, rest) = split
+        segment = (stack, link)
+        tasks.extendleft(reversed(
+            [(child, None, (segment, i)) for (i, child) in branches] +
+            [(stack[i], j, (segment, i)) for (i, j) in rest]))
+
+    add_branches(None, result)
+    # encoding puzzle registers the context that every puzzle of the
+    # search refers to, so that each worker is sent it once
+    encode(puzzle)
+    event = multiprocessing.get_context().Event()
+    executor = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=_init_worker,
+                                   initargs=(event, contexts()))
+    running = {}
+    try:
+        while tasks or running:
+            while tasks and len(running) < 2 * workers:
+                (child, j, link) = tasks.popleft()
+                if j is not None:
+                    # make the subtrees of the extensions of child again
+                    tasks.extendleft(reversed(
+                        [(grandchild, None, link)
+                         for grandchild in list(child.extensions())[j:]]))
+                    continue
+                key = child.canonical_key()
+                if key not in seen:
+                    seen.add(key)
+                    # encode here, so that a puzzle that cannot be
+                    # encoded raises in this process rather than
+                    # breaking the pool
+                    future = executor.submit(_explore_encoded,
+                                             encode(child), budget)
+                    running[future] = link
+            if not running:
+                continue
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                raise TimeoutError("no solution found in {} seconds".format(
+                    timeout))
+            (done, _) = wait(running, timeout=left,
+                             return_when=FIRST_COMPLETED)
+            for future in done:
+                link = running.pop(future)
+                (status, result, keys) = future.result()
+                result = _decoded(status, result)
+                if status == "solved":
+                    return _path_to_node(link, result)
+                if len(seen) < _MAX_SEEN:
+                    seen.update(keys)
+                if status == "split":
+                    # search the new subtrees next, keeping roughly the
+                    # left-to-right order of a serial search
+                    add_branches(link, result)
+        return None
+    finally:
+        # have any running workers give up on their subtrees, whether a
+        # solution was found, a task raised or the caller was interrupted
+        event.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    from grid_peg_solitaire_puzzle import GridPegSolitairePuzzle
+    from puzzle_tools import depth_first_solve
+    from time import time
+    grid = [["*", "*", "*", "*", "*"],
+            ["*", "*", "*", "*", "*"],
+            ["*", "*", "*", "*", "*"],
+            ["*", "*", ".", "*", "*"],
+            ["*", "*", "*", "*", "*"]]
+    gpsp = GridPegSolitairePuzzle(grid, {"*", ".", "#"})
+    start = time()
+    solution = depth_first_solve(gpsp)
+    end = time()
+    print("Solved 5x5 peg solitaire in {} seconds using depth-first.".format(
+        end - start))
+    start = time()
+    solution = parallel_depth_first_solve(gpsp)
+    end = time()
+    print("Solved 5x5 peg solitaire in {} seconds using {} workers.".format(
+        end - start, os.cpu_count()))
@@ -16,6 +16,58 @@ class Puzzle:
         """
         return False
 
+    def canonical_key(self):
+        """
+        Return a hashable key for Puzzle self, used by solvers to
+        recognise configurations they have already seen.
+
+        Override this in a subclass where symmetric configurations, which
+        are solvable exactly when self is, can share one key.
+
+        @type self: Puzzle
+        @rtype: Hashable
+        """
+        return str(self)
+
+    def heuristic(self):
+        """
+        Return a lower bound on the number of extensions between Puzzle
+        self and a solution, which informed solvers search towards.
+
+        Override this in a subclass where such a bound is known.  It
+        should never overestimate, and should fall by at most 1 from a
+        Puzzle to any of its extensions, for a_star_solve to find
+        shortest paths.
+
+        @type self: Puzzle
+        @rtype: int
+        """
+        return 0
+
+    def to_bytes(self):
+        """
+        Return a compact encoding of Puzzle self, from which from_bytes
+        rebuilds it, in the format of puzzle_codec.
+
+        Override this in a subclass that can be sent between processes
+        or saved without pickling it whole.
+
+        @type self: Puzzle
+        @rtype: bytes
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Return the Puzzle encoded in data by to_bytes.
+
+        @type cls: type
+        @type data: bytes
+        @rtype: Puzzle
+        """
+        raise NotImplementedError
+
     def is_solved(self):
         """
         Return True iff Puzzle self is solved.
@@ -0,0 +1,298 @@
+"""
+Compact, versioned byte encodings of puzzle states.
+
+An encoded state is a 10-byte header, then a payload defined by its
+puzzle class:
+
+    version      the format version (8-bit)
+    tag          which puzzle class encoded it (8-bit)
+    fingerprint  64-bit fingerprint of the state's context (little-endian)
+
+The context is what every state of one search shares, such as the word
+set of a WordLadderPuzzle or the goal grid of an MNPuzzle.  It is kept
+here by fingerprint when a state is encoded and looked up again when one
+is decoded, so it is sent once, by reference, rather than with every
+state.  A process that decodes states encoded elsewhere gets the
+contexts once, with add_contexts(contexts()) pickled across, and must
+keep them alive while it decodes.
+
+Contexts that can be weakly referenced, such as word sets, are only
+kept here while something else refers to them, so the registry does not
+undo their interning.  The others are small tuples describing a board,
+a goal grid or a set of symbols, kept for the life of the process: one
+per board, goal or symbol set ever encoded.
+"""
+import hashlib
+import pickle
+import struct
+import weakref
+
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<BBQ")
+
+# fingerprint -> context that can be weakly referenced
+_contexts = weakref.WeakValueDictionary()
+# fingerprint -> context that cannot, such as a tuple
+_small_contexts = {}
+# tag -> puzzle class
+_classes = {}
+
+
+def context_fingerprint(*parts):
+    """
+    Return a 64-bit fingerprint of a context made of parts, which must
+    have a stable repr.
+
+    @type parts: tuple
+    @rtype: int
+
+    >>> context_fingerprint("mn", ("1", "*")) == context_fingerprint(
+    ...     "mn", ("1", "*"))
+    True
+    >>> context_fingerprint(2, 3) == context_fingerprint(3, 2)
+    False
+    """
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
+
+
+def register_context(fingerprint, context):
+    """
+    Remember context under fingerprint, for decoding states that refer
+    to it.
+
+    @type fingerprint: int
+    @type context: object
+    @rtype: None
+    """
+    if fingerprint in _contexts or fingerprint in _small_contexts:
+        return
+    try:
+        _contexts[fingerprint] = context
+    except TypeError:
+        _small_contexts[fingerprint] = context
+
+
+def lookup_context(fingerprint):
+    """
+    Return the context remembered under fingerprint, or raise KeyError
+    if it was never registered in this process or is no longer used.
+
+    @type fingerprint: int
+    @rtype: object
+
+    >>> from word_ladder_puzzle import WordLadderPuzzle
+    >>> w = WordLadderPuzzle("ox", "ax", {"ox", "ax", "bx"})
+    >>> fingerprint = unpack(w.to_bytes(), 1)[0]
+    >>> lookup_context(fingerprint) is w._word_set
+    True
+    >>> del w
+    >>> try:
+    ...     lookup_context(fingerprint)
+    ... except KeyError:
+    ...     print("no longer used")
+    no longer used
+    """
+    context = _contexts.get(fingerprint, _small_contexts.get(fingerprint))
+    if context is None:
+        raise KeyError("context {:016x} is not registered: call add_contexts "
+                       "with the contexts of the encoding process".format(
+                           fingerprint))
+    return context
+
+
+def contexts():
+    """
+    Return the contexts registered in this process, by fingerprint, to
+    be pickled and passed to add_contexts elsewhere.
+
+    @rtype: dict[int, object]
+    """
+    more = dict(_small_contexts)
+    more.update(_contexts)
+    return more
+
+
+def add_contexts(more):
+    """
+    Register each context in more, a result of contexts().
+
+    @type more: dict[int, object]
+    @rtype: None
+    """
+    for (fingerprint, context) in more.items():
+        register_context(fingerprint, context)
+
+
+def register_class(tag, cls):
+    """
+    Make decode turn states with tag into instances of cls.
+
+    @type tag: int
+    @type cls: type
+    @rtype: None
+    """
+    _classes[tag] = cls
+
+
+def pack(tag, fingerprint, payload):
+    """
+    Return the encoding of a state of the class with tag, with context
+    fingerprint and payload.
+
+    @type tag: int
+    @type fingerprint: int
+    @type payload: bytes
+    @rtype: bytes
+
+    >>> data = pack(7, 42, b"abc")
+    >>> len(data), unpack(data, 7)
+    (13, (42, b'abc'))
+    """
+    return _HEADER.pack(FORMAT_VERSION, tag, fingerprint) + payload
+
+
+def unpack(data, tag):
+    """
+    Return the context fingerprint and payload of data, the encoding of
+    a state of the class with tag, or raise ValueError if it is not one.
+
+    @type data: bytes
+    @type tag: int
+    @rtype: (int, bytes)
+
+    >>> unpack(pack(7, 42, b""), 8)
+    Traceback (most recent call last):
+    ...
+    ValueError: expected a state with tag 8, not 7
+    """
+    if len(data) < _HEADER.size:
+        raise ValueError("{} bytes is too short for a state".format(len(data)))
+    (version, found, fingerprint) = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError("cannot read format version {}".format(version))
+    if found != tag:
+        raise ValueError("expected a state with tag {}, not {}".format(
+            tag, found))
+    return fingerprint, bytes(data[_HEADER.size:])
+
+
+def encode(puzzle):
+    """
+    Return puzzle.to_bytes(), or puzzle pickled if its class does not
+    implement to_bytes, for decode to turn back into puzzle.
+
+    @type puzzle: Puzzle
+    @rtype: bytes
+
+    >>> from puzzle import Puzzle
+    >>> decode(encode(Puzzle())).__class__.__name__
+    'Puzzle'
+    """
+    try:
+        return puzzle.to_bytes()
+    except NotImplementedError:
+        return pickle.dumps(puzzle, pickle.HIGHEST_PROTOCOL)
+
+
+def decode(data):
+    """
+    Return the puzzle encoded in data by encode, or by the to_bytes of
+    any puzzle class whose module was imported.
+
+    @type data: bytes
+    @rtype: Puzzle
+
+    >>> from mn_puzzle import MNPuzzle
+    >>> m = MNPuzzle((("1", "*"),), (("*", "1"),))
+    >>> decode(m.to_bytes()) == m
+    True
+
+    Every state reachable from these starts comes back equal:
+
+    >>> from grid_peg_solitaire_puzzle import GridPegSolitairePuzzle
+    >>> from sudoku_puzzle import SudokuPuzzle
+    >>> from word_ladder_puzzle import WordLadderPuzzle
+    >>> grid = [["*"] * 5 for _ in range(5)]
+    >>> grid[3][2] = "."
+    >>> starts = [
+    ...     WordLadderPuzzle("cold", "warm", {"cold", "cord", "card", "ward",
+    ...                                       "warm", "wold", "word", "worm"}),
+    ...     GridPegSolitairePuzzle(grid, {"*", ".", "#"}),
+    ...     MNPuzzle((("1", "2", "3"), ("4", "5", "6"), ("7", "8", "*")),
+    ...              (("8", "1", "3"), ("4", "*", "2"), ("7", "6", "5"))),
+    ...     SudokuPuzzle(4, ["*"] * 16, {"A", "B", "C", "D"})]
+    >>> samples = [_reachable(start, 300) for start in starts]
+    >>> [len(states) for states in samples]
+    [300, 300, 300, 300]
+    >>> all([decode(state.to_bytes()) == state
+    ...      for states in samples for state in states])
+    True
+    """
+    # pickles start with the PROTO opcode, which no FORMAT_VERSION uses
+    if data[:1] == pickle.PROTO:
+        return pickle.loads(data)
+    if len(data) < _HEADER.size or data[1] not in _classes:
+        raise ValueError("not the encoding of a known puzzle class")
+    return _classes[data[1]].from_bytes(data)
+
+
+def _reachable(puzzle, size):
+    # Return up to size states reachable from puzzle, breadth-first.
+    #
+    # @type puzzle: Puzzle
+    # @type size: int
+    # @rtype: list[Puzzle]
+    states, i = [puzzle], 0
+    while i < len(states) and len(states) < size:
+        states.extend(states[i].extensions())
+        i += 1
+    return states[:size]
+
+
+if __name__ == "__main__":
+    import doctest
+    # the puzzle modules register with puzzle_codec, not with __main__
+    import puzzle_codec
+    doctest.testmod(puzzle_codec)
+    import pickle
+    from time import time
+    from grid_peg_solitaire_puzzle import GridPegSolitairePuzzle
+    from mn_puzzle import MNPuzzle
+    from sudoku_puzzle import SudokuPuzzle
+    from word_ladder_puzzle import WordLadderPuzzle
+
+    with open("words", "r") as words:
+        word_set = set(words.read().split())
+    grid = [["*"] * 5 for _ in range(5)]
+    grid[3][2] = "."
+    sudoku = ["*", "*", "*", "7", "*", "8", "*", "1", "*",
+              "*", "*", "7", "*", "9", "*", "*", "*", "6",
+              "9", "*", "3", "1", "*", "*", "*", "*", "*",
+              "3", "5", "*", "8", "*", "*", "6", "*", "1",
+              "*", "*", "*", "*", "*", "*", "*", "*", "*",
+              "1", "*", "6", "*", "*", "9", "*", "4", "8",
+              "*", "*", "*", "*", "*", "1", "2", "*", "7",
+              "8", "*", "*", "*", "7", "*", "4", "*", "*",
+              "*", "6", "*", "3", "*", "2", "*", "*", "*"]
+    for (name, puzzle) in (
+            ("word ladder", WordLadderPuzzle("same", "cost", word_set)),
+            ("peg solitaire", GridPegSolitairePuzzle(grid, {"*", ".", "#"})),
+            ("MN", MNPuzzle((("1", "2", "3"), ("4", "5", "6"),
+                             ("7", "8", "*")),
+                            (("8", "1", "3"), ("4", "*", "2"),
+                             ("7", "6", "5")))),
+            ("sudoku", SudokuPuzzle(9, sudoku, set("123456789")))):
+        states = puzzle_codec._reachable(puzzle, 2000)
+        start = time()
+        encoded = [state.to_bytes() for state in states]
+        middle = time()
+        decoded = [type(puzzle).from_bytes(data) for data in encoded]
+        end = time()
+        assert decoded == states
+        pickled = sum([len(pickle.dumps(state)) for state in states])
+        print("{}: {:.1f} bytes per state ({:.1f} pickled), {:.0f} encodes/s, "
+              "{:.0f} decodes/s".format(
+                  name, sum(map(len, encoded)) / len(states),
+                  pickled / len(states), len(states) / (middle - start),
+                  len(states) / (end - middle)))
@@ -2,7 +2,12 @@
 Some functions for working with puzzles
 """
 from puzzle import Puzzle
+from puzzle_codec import decode, encode
 from collections import deque
+import heapq
+import os
+import pickle
+import time
 # set higher recursion limit
 # which is needed in PuzzleNode.__str__
 # you may uncomment the next lines on a unix system such as CDF
@@ -16,40 +21,131 @@ sys.setrecursionlimit(10**6)
 # do NOT change the type contract
 # you are welcome to create any helper functions
 # you like
-def depth_first_solve(puzzle):
+def depth_first_solve(puzzle, checkpoint=None, interval=60.0,
+                      tracer=None, budget=None):
     """
     Return a path from PuzzleNode(puzzle) to a PuzzleNode containing
     a solution, with each child containing an extension of the puzzle
     in its parent.  Return None if this is not possible.
 
+    If checkpoint is a file path, the search state is saved there every
+    interval seconds, and a search interrupted after saving it resumes
+    from it when called again with the same puzzle and checkpoint, with
+    the same result.  The files are removed once the search ends.  The
+    puzzles seen are saved as they are found, and the current path only
+    as the place of each of its puzzles among the extensions of the one
+    before, so extensions must return the same list every time it is
+    called on equal puzzles.
+
+    If tracer is a SearchTracer, the time spent in each phase of the
+    search is traced with it.  If budget is not None, it is called with
+    no arguments before each puzzle is expanded, and may stop the search
+    by raising an exception.
+
     @type puzzle: Puzzle
-    @rtype: PuzzleNode
+    @type checkpoint: str | None
+    @type interval: float
+    @type tracer: SearchTracer | None
+    @type budget: function | None
+    @rtype: PuzzleNode | None
+
+    >>> from word_ladder_puzzle import WordLadderPuzzle
+    >>> w = WordLadderPuzzle("bill", "tall", {"bill", "bell", "tell", "tall"})
+    >>> node = depth_first_solve(w)
+    >>> while node.children:
+    ...     node = node.children[0]
+    >>> print(node.puzzle)
+    tall -> tall
+
+    A search interrupted by an exception resumes where it was saved:
+
+    >>> import os, tempfile
+    >>> from mn_puzzle import MNPuzzle
+    >>> m = MNPuzzle((("*", "2", "3"), ("1", "4", "5")),
+    ...              (("1", "2", "3"), ("4", "5", "*")))
+    >>> path = os.path.join(tempfile.mkdtemp(), "search")
+    >>> extensions, calls = MNPuzzle.extensions, []
+    >>> def interrupted(self):
+    ...     calls.append(self)
+    ...     if len(calls) == 10:
+    ...         raise KeyboardInterrupt
+    ...     return extensions(self)
+    >>> MNPuzzle.extensions = interrupted
+    >>> try:
+    ...     depth_first_solve(m, path, 0.0)
+    ... except KeyboardInterrupt:
+    ...     print(os.path.exists(path), os.path.exists(path + ".journal"))
+    True True
+    >>> MNPuzzle.extensions = extensions
+    >>> str(depth_first_solve(m, path)) == str(depth_first_solve(m))
+    True
+    >>> os.listdir(os.path.dirname(path))
+    []
     """
-    # define create_depth_path so I can have a set seen in my parameter to keep track of Puzzles that I already seen.
-    def create_depth_path(start, seen=set()):
-        """
-        Return a path with no duplication of PuzzleNode from PuzzleNode(puzzle) to a PuzzleNode containing
-        a solution, with each child containing an extension of the puzzle
-        in its parent.  Return None if this is not possible.
+    if tracer is not None:
+        return tracer.run(depth_first_solve, puzzle, checkpoint, interval,
+                          None, budget)
+    seen = {puzzle.canonical_key()}
+    if puzzle.fail_fast():
+        return None
+    if puzzle.is_solved():
+        return PuzzleNode(puzzle)
+    if budget is not None:
+        budget()
+    # [puzzle, its extensions, index of the next one to try] for each
+    # puzzle on the current path, as the recursive search would have
+    stack = [[puzzle, list(puzzle.extensions()), 0]]
+    journal = None
+    if checkpoint is not None:
+        journal = _Checkpoint(checkpoint, "depth-first", next(iter(seen)))
+        places = journal.resume(seen.add)
+        if places is not None:
+            # walk the saved path down again from puzzle
+            stack[0][2] = places[0]
+            for i in places[1:]:
+                (_, children, j) = stack[-1]
+                child = children[j - 1]
+                stack.append([child, list(child.extensions()), i])
+    try:
+        while stack:
+            if journal is not None and journal.due(interval):
+                journal.save([i for (_, _, i) in stack])
+            entry = stack[-1]
+            (_, children, i) = entry
+            if i == len(children):
+                stack.pop()
+                continue
+            entry[2] = i + 1
+            child = children[i]
+            key = child.canonical_key()  # shared by symmetric Puzzles
+            if key in seen:
+                continue
+            seen.add(key)
+            if journal is not None:
+                journal.record(key)
+            if child.fail_fast():
+                continue
+            if child.is_solved():
+                return _path([p for (p, _, _) in stack] + [child])
+            if budget is not None:
+                budget()
+            stack.append([child, list(child.extensions()), 0])
+        return None
+    finally:
+        if journal is not None:
+            journal.close()
 
-        @type start: Puzzle
-        @type seen: set
-        @rtype: PuzzleNode
-        """
-        seen.add(str(start))   # use string instead of Puzzle because string is hashable
-        if start.fail_fast():  # If the puzzle failed
-            return None
-        if start.is_solved():  # If the puzzle is solved
-            return start
-        if start is None:      # If the puzzle is None, which I don't think will happen but just in case.
-            return None
-        else:
-            for node in start.extensions():
-                if str(node) not in seen:  # check whether or not I have seen this Puzzle
-                    solution = create_depth_path(node, seen)
-                    if solution:           # If there is a solution returned
-                        return create_puzzlenode(start, solution)  # call helper function
-    return create_depth_path(puzzle)
+
+def _path(puzzles):
+    # Return the path of PuzzleNodes through puzzles, each one the child
+    # of the one before it.
+    #
+    # @type puzzles: list[Puzzle]
+    # @rtype: PuzzleNode
+    node = PuzzleNode(puzzles[-1])
+    for puzzle in reversed(puzzles[:-1]):
+        node = create_puzzlenode(puzzle, node)
+    return node
 
 
 def create_puzzlenode(puzzle, item):
@@ -75,60 +171,392 @@ def create_puzzlenode(puzzle, item):
 # you like
 # Hint: you may find a queue useful, that's why
 # we imported deque
-def breadth_first_solve(puzzle):
+def breadth_first_solve(puzzle, checkpoint=None, interval=60.0,
+                        tracer=None, budget=None):
     """
     Return a path from PuzzleNode(puzzle) to a PuzzleNode containing
     a solution, with each child PuzzleNode containing an extension
     of the puzzle in its parent.  Return None if this is not possible.
 
+    If checkpoint is a file path, the search is saved and resumed as in
+    depth_first_solve.  Only the puzzles expanded so far and the place
+    of the front of the queue are saved, and the rest of the queue is
+    rebuilt from their extensions, so extensions must return the same
+    list every time it is called on equal puzzles.
+
+    If tracer is a SearchTracer, or budget is not None, the search is
+    traced with it, or budget is called, as in depth_first_solve.
+
     @type puzzle: Puzzle
-    @rtype: PuzzleNode
+    @type checkpoint: str | None
+    @type interval: float
+    @type tracer: SearchTracer | None
+    @type budget: function | None
+    @rtype: PuzzleNode | None
+
+    >>> from word_ladder_puzzle import WordLadderPuzzle
+    >>> w = WordLadderPuzzle("bill", "tall", {"bill", "bell", "tell", "tall"})
+    >>> node, depth = breadth_first_solve(w), 0
+    >>> while node.children:
+    ...     node, depth = node.children[0], depth + 1
+    >>> depth
+    3
+
+    >>> import os, tempfile
+    >>> from mn_puzzle import MNPuzzle
+    >>> m = MNPuzzle((("5", "4", "3"), ("2", "1", "*")),
+    ...              (("1", "2", "3"), ("4", "5", "*")))
+    >>> path = os.path.join(tempfile.mkdtemp(), "search")
+    >>> extensions, calls = MNPuzzle.extensions, []
+    >>> def interrupted(self):
+    ...     calls.append(self)
+    ...     if len(calls) == 100:
+    ...         raise KeyboardInterrupt
+    ...     return extensions(self)
+    >>> MNPuzzle.extensions = interrupted
+    >>> try:
+    ...     breadth_first_solve(m, path, 0.0)
+    ... except KeyboardInterrupt:
+    ...     print(os.path.exists(path), os.path.exists(path + ".journal"))
+    True True
+    >>> MNPuzzle.extensions = extensions
+    >>> resumed = breadth_first_solve(m, path)
+    >>> str(resumed) == str(breadth_first_solve(m))
+    True
+    >>> os.listdir(os.path.dirname(path))
+    []
+    """
+    if tracer is not None:
+        return tracer.run(breadth_first_solve, puzzle, checkpoint, interval,
+                          None, budget)
+    # puzzles expanded so far, and the index in expanded of the parent
+    # of each, by the order they were expanded in
+    expanded, parents, seen = [], [], set()
+    # (puzzle, index of its parent in expanded, index of puzzle in the
+    # parent's extensions) of each puzzle waiting to be looked at; these
+    # are always the extensions of consecutive puzzles of expanded
+    q = deque([(puzzle, None, 0)])
+    journal = None
+    if checkpoint is not None:
+        journal = _Checkpoint(checkpoint, "breadth-first",
+                              puzzle.canonical_key())
+        # encoding puzzle registers the context that the puzzles in the
+        # journal refer to
+        encode(puzzle)
+
+        def replay(record):
+            # Redo the expansion of a puzzle recorded in the journal.
+            (key, data, parent) = record
+            seen.add(key)
+            expanded.append(decode(data))
+            parents.append(parent)
+
+        head = journal.resume(replay)
+        if head is not None:
+            q.clear()
+            (parent, i) = head
+            for j in range(parent, len(expanded)):
+                children = list(expanded[j].extensions())
+                q.extend([(children[k], j, k)
+                          for k in range(i if j == parent else 0,
+                                         len(children))])
+    try:
+        while q:
+            (next_puzzle, parent, i) = q.popleft()
+            key = next_puzzle.canonical_key()
+            if key not in seen:        # make sure we never seen this Puzzle before
+                seen.add(key)
+                if next_puzzle.is_solved():  # If puzzle is solved
+                    return _lineage(next_puzzle, parent, expanded, parents)
+                expanded.append(next_puzzle)
+                parents.append(parent)
+                if journal is not None:
+                    journal.record((key, encode(next_puzzle), parent))
+                if budget is not None:
+                    budget()
+                children = list(next_puzzle.extensions())
+                q.extend([(children[k], len(expanded) - 1, k)
+                          for k in range(len(children))])
+            if journal is not None and q and journal.due(interval):
+                journal.save(q[0][1:])
+        return None
+    finally:
+        if journal is not None:
+            journal.close()
+
+
+def a_star_solve(puzzle, tracer=None, budget=None):
+    """
+    Return a path from PuzzleNode(puzzle) to a PuzzleNode containing
+    a solution, with each child PuzzleNode containing an extension
+    of the puzzle in its parent.  Return None if this is not possible.
+
+    Puzzles are expanded in order of their distance from puzzle plus
+    their heuristic, so the path is a shortest one as long as heuristic
+    is a lower bound as Puzzle.heuristic describes.  If tracer is a
+    SearchTracer, or budget is not None, the search is traced with it,
+    or budget is called, as in depth_first_solve.
+
+    @type puzzle: Puzzle
+    @type tracer: SearchTracer | None
+    @type budget: function | None
+    @rtype: PuzzleNode | None
+
+    >>> from mn_puzzle import MNPuzzle
+    >>> goal = (("1", "2", "3"), ("4", "5", "*"))
+    >>> node, depth = a_star_solve(MNPuzzle((("*", "2", "3"),
+    ...                                      ("1", "4", "5")), goal)), 0
+    >>> while node.children:
+    ...     node, depth = node.children[0], depth + 1
+    >>> depth, node.puzzle.is_solved()
+    (3, True)
+    """
+    if tracer is not None:
+        return tracer.run(a_star_solve, puzzle, None, budget)
+    # puzzles expanded so far, and the index in expanded of the parent
+    # of each, by the order they were expanded in
+    expanded, parents, seen = [], [], set()
+    # (distance + heuristic, heuristic, order pushed, distance, puzzle,
+    # index of its parent in expanded) of each puzzle waiting to be
+    # looked at; of equal estimates, the one nearer a solution is first
+    h = puzzle.heuristic()
+    heap, pushed = [(h, h, 0, 0, puzzle, None)], 1
+    while heap:
+        (_, _, _, distance, next_puzzle, parent) = heapq.heappop(heap)
+        key = next_puzzle.canonical_key()
+        if key in seen:
+            continue
+        seen.add(key)
+        if next_puzzle.fail_fast():
+            continue
+        if next_puzzle.is_solved():
+            return _lineage(next_puzzle, parent, expanded, parents)
+        expanded.append(next_puzzle)
+        parents.append(parent)
+        if budget is not None:
+            budget()
+        for child in next_puzzle.extensions():
+            h = child.heuristic()
+            heapq.heappush(heap, (distance + 1 + h, h, pushed, distance + 1,
+                                  child, len(expanded) - 1))
+            pushed += 1
+    return None
+
+
+def anytime_solve(puzzle, weight=3.0, seconds=None):
+    """
+    Yield (path, cost, bound) each time a better path from
+    PuzzleNode(puzzle) to a PuzzleNode containing a solution is found,
+    where path is as in breadth_first_solve, cost is its number of
+    extensions and bound is the fewest any path can have.
+
+    This is anytime weighted A*: puzzles are expanded in order of their
+    distance from puzzle plus weight times their heuristic, so a first
+    path is found quickly, and the search goes on, skipping puzzles that
+    cannot lead to a shorter path than the last one yielded, until no
+    others are left or seconds pass, if seconds is not None.  Once no
+    others are left the last path is a shortest one, as long as
+    heuristic is a lower bound as Puzzle.heuristic describes, and it is
+    yielded again with bound equal to its cost if that was not yet
+    known.  A weight of 1 is a_star_solve.
+
+    @type puzzle: Puzzle
+    @type weight: float
+    @type seconds: float | None
+    @rtype: generator[(PuzzleNode, int, int)]
+
+    >>> from mn_puzzle import MNPuzzle
+    >>> goal = (("1", "2", "3"), ("4", "5", "6"), ("7", "8", "*"))
+    >>> m = MNPuzzle((("8", "6", "7"), ("2", "5", "4"), ("3", "*", "1")), goal)
+    >>> [(cost, bound) for (_, cost, bound) in anytime_solve(m, 3.0)]
+    [(35, 23), (31, 23), (31, 31)]
+    >>> m = MNPuzzle((("8", "1", "3"), ("4", "*", "2"), ("7", "6", "5")), goal)
+    >>> [(cost, bound) for (_, cost, bound) in anytime_solve(m, 1.0)]
+    [(14, 14)]
+    >>> (path, cost, bound) = next(anytime_solve(m))
+    >>> while path.children:
+    ...     path = path.children[0]
+    >>> path.puzzle.is_solved()
+    True
     """
-    # create a puzzle node
-    # create queue
-
-    def create_breadth_path(start, seen=set()):
-        """
-        Return a path with no duplicate from PuzzleNode(puzzle) to a PuzzleNode containing
-        a solution, with each child PuzzleNode containing an extension
-        of the puzzle in its parent.  Return None if this is not possible.
-        @type start: Puzzle
-        @type seen: set
-        @rtype: PuzzleNode
-        """
-        q = deque()
-        start = PuzzleNode(start)
-        start.parent = start
-        q.append(start)
-        while not len(q) == 0:
-            next_puzzle = q.popleft()               # pop the first item in q
-            if str(next_puzzle.puzzle) not in seen:        # make sure we never seen this PuzzleNode before
-                seen.add(str(next_puzzle.puzzle))
-                if next_puzzle.puzzle.is_solved():  # If puzzle is solved
-                    return return_path(next_puzzle)
-                else:
-                    for child in next_puzzle.puzzle.extensions():
-                        child = PuzzleNode(child)
-                        child.parent = next_puzzle
-                        next_puzzle.children.append(child)
-                        q.append(child)             # put child in q
-
-    def return_path(leaf):
-        """
-        Return PuzzleNode that has one children that has one children that has one children... eventually reaches the leaf.
-
-        @type leaf: PuzzleNode
-        @rtype: PuzzleNode
-        """
-        if leaf.puzzle == puzzle:  # if we are back to the root of the tree
-            return leaf
-        else:                      # if we are not at the root yet
-            new_node = PuzzleNode(leaf.parent.puzzle, [leaf], leaf.parent.parent)
-            # create a new PuzzleNode that only has 1 children
-            leaf.parent = new_node
-            return return_path(new_node)
-
-    return create_breadth_path(puzzle)
+    deadline = None if seconds is None else time.time() + seconds
+    # puzzles expanded so far, and the index in expanded of the parent
+    # of each, by the order they were expanded in
+    expanded, parents = [], []
+    # canonical key -> fewest extensions it was reached in so far
+    reached = {puzzle.canonical_key(): 0}
+    # (distance + weight * heuristic, heuristic, order pushed, distance,
+    # puzzle, its canonical key, index of its parent in expanded) of each
+    # puzzle waiting to be looked at
+    h = puzzle.heuristic()
+    heap = [(weight * h, h, 0, 0, puzzle, next(iter(reached)), None)]
+    pushed, best, cost, bound = 1, None, None, None
+    while heap:
+        if deadline is not None and time.time() >= deadline:
+            return
+        (_, h, _, distance, next_puzzle, key, parent) = heapq.heappop(heap)
+        if reached[key] < distance or (cost is not None and
+                                       distance + h >= cost):
+            # reached more directly since, or no shorter than best
+            continue
+        if next_puzzle.fail_fast():
+            continue
+        if next_puzzle.is_solved():
+            best = _lineage(next_puzzle, parent, expanded, parents)
+            cost = distance
+            # the waiting puzzles are all that could lead to shorter paths
+            bound = min([d + h for (_, h, _, d, _, _, _) in heap] + [cost])
+            yield best, cost, bound
+            continue
+        expanded.append(next_puzzle)
+        parents.append(parent)
+        for child in next_puzzle.extensions():
+            child_key = child.canonical_key()
+            if reached.get(child_key, distance + 2) <= distance + 1:
+                continue
+            h = child.heuristic()
+            if cost is not None and distance + 1 + h >= cost:
+                continue
+            reached[child_key] = distance + 1
+            heapq.heappush(heap, (distance + 1 + weight * h, h, pushed,
+                                  distance + 1, child, child_key,
+                                  len(expanded) - 1))
+            pushed += 1
+    if best is not None and bound < cost:
+        yield best, cost, cost
+
+
+def _lineage(puzzle, parent, expanded, parents):
+    # Return the path of PuzzleNodes to puzzle, whose parent is at index
+    # parent of expanded, the puzzles a search expanded, with the index
+    # in expanded of the parent of each at the same index of parents.
+    #
+    # @type puzzle: Puzzle
+    # @type parent: int | None
+    # @type expanded: list[Puzzle]
+    # @type parents: list[int | None]
+    # @rtype: PuzzleNode
+    puzzles = [puzzle]
+    while parent is not None:
+        puzzles.append(expanded[parent])
+        parent = parents[parent]
+    return _path(puzzles[::-1])
+
+
+class _Checkpoint:
+    """
+    The saved state of one search, in two files: an append-only journal
+    of what the search has seen, written as it goes, and a snapshot of
+    the rest of its state, which is replaced atomically and records how
+    much of the journal it goes with.
+
+    Each record is pickled on its own, so nothing is kept alive between
+    records.  Puzzles should be recorded encoded with puzzle_codec.encode,
+    which refers to what they share, such as the word set of a
+    WordLadderPuzzle, rather than writing it into every record.
+    """
+    VERSION = 2
+
+    def __init__(self, path, kind, root):
+        """
+        Create a new _Checkpoint self, at path, for the kind of search
+        starting from the puzzle with canonical key root.
+
+        @type self: _Checkpoint
+        @type path: str
+        @type kind: str
+        @type root: Hashable
+        @rtype: None
+        """
+        self.path, self.kind, self.root = path, kind, root
+        self._journal, self._last = None, time.time()
+
+    def resume(self, replay):
+        """
+        Call replay on each record of the journal of the snapshot at the
+        path of _Checkpoint self, and return the state saved with it, or
+        None if there is no snapshot.  Start an empty journal if there
+        is no snapshot.
+
+        @type self: _Checkpoint
+        @type replay: function
+        @rtype: object | None
+        """
+        journal_path = self.path + ".journal"
+        if not os.path.exists(self.path):
+            self._journal = open(journal_path, "wb")
+            return None
+        with open(self.path, "rb") as f:
+            (version, kind, root, offset, state) = pickle.load(f)
+        if (version, kind, root) != (self.VERSION, self.kind, self.root):
+            raise ValueError("{} is not a checkpoint of this {} search".format(
+                self.path, self.kind))
+        with open(journal_path, "rb") as f:
+            while f.tell() < offset:
+                replay(pickle.load(f))
+        # drop whatever was written after the snapshot was taken
+        self._journal = open(journal_path, "r+b")
+        self._journal.truncate(offset)
+        self._journal.seek(offset)
+        return state
+
+    def record(self, item):
+        """
+        Append item to the journal of _Checkpoint self.
+
+        @type self: _Checkpoint
+        @type item: object
+        @rtype: None
+        """
+        self._journal.write(pickle.dumps(item, pickle.HIGHEST_PROTOCOL))
+
+    def due(self, interval):
+        """
+        Return whether at least interval seconds passed since the last
+        snapshot of _Checkpoint self.
+
+        @type self: _Checkpoint
+        @type interval: float
+        @rtype: bool
+        """
+        return time.time() - self._last >= interval
+
+    def save(self, state):
+        """
+        Replace the snapshot of _Checkpoint self by one of state and the
+        journal written so far.
+
+        @type self: _Checkpoint
+        @type state: object
+        @rtype: None
+        """
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        temporary = self.path + ".tmp"
+        with open(temporary, "wb") as f:
+            pickle.dump((self.VERSION, self.kind, self.root,
+                         self._journal.tell(), state), f,
+                        pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self._last = time.time()
+
+    def close(self):
+        """
+        Remove the files of _Checkpoint self, once its search is over.
+
+        If the search was interrupted by an exception, the files are
+        kept so that it can be resumed.
+
+        @type self: _Checkpoint
+        @rtype: None
+        """
+        self._journal.close()
+        if sys.exc_info()[0] is None:
+            for path in (self.path, self.path + ".journal"):
+                if os.path.exists(path):
+                    os.remove(path)
 
 
 # Class PuzzleNode helps build trees of PuzzleNodes that have
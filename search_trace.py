@@ -0,0 +1,515 @@
+"""
+Trace where the time and memory of a search go.
+
+A SearchTracer times every call a solver makes on its puzzles, by phase
+and puzzle class:
+
+    extensions     Puzzle.extensions
+    canonical_key  Puzzle.canonical_key
+    hash           hashing canonical keys, to look them up in seen sets
+    dedup          comparing canonical keys whose hashes are equal
+    fail_fast      Puzzle.fail_fast
+    is_solved      Puzzle.is_solved
+    heuristic      Puzzle.heuristic
+
+and writes a sample of the calls, with the memory traced by tracemalloc
+as states are visited, to a file of Chrome trace events, which
+chrome://tracing or https://ui.perfetto.dev open.  Events are written as
+they happen, so tracing a long search does not keep them in memory.
+The total time of each phase is written, when the tracer is closed, as
+collapsed stacks for flamegraph.pl or https://www.speedscope.app.
+
+    with SearchTracer("search.trace.json", "search.stacks") as tracer:
+        node = breadth_first_solve(puzzle, tracer=tracer)
+"""
+from collections import defaultdict
+import json
+import os
+from time import perf_counter
+import tracemalloc
+
+# the order phases are listed in
+PHASES = ("extensions", "canonical_key", "hash", "dedup", "fail_fast",
+          "is_solved", "heuristic")
+
+
+class SearchTracer:
+    """
+    Times and memory of the searches run with it, written as Chrome
+    trace events and collapsed stacks.
+    """
+
+    def __init__(self, trace_path=None, stacks_path=None, sample=100,
+                 memory=True):
+        """
+        Create a new SearchTracer self writing trace events to trace_path
+        and collapsed stacks to stacks_path, each if it is not None.
+
+        One call in every sample of each phase and puzzle class is
+        written as a trace event, as is the memory traced when one state
+        in every sample is visited, if memory is true.  Tracing memory
+        slows every allocation, so searches run slower with it.
+
+        @type self: SearchTracer
+        @type trace_path: str | None
+        @type stacks_path: str | None
+        @type sample: int
+        @type memory: bool
+        @rtype: None
+        """
+        self.stacks_path, self.sample, self.memory = (stacks_path, sample,
+                                                      memory)
+        # (solver, puzzle class, phase) -> total seconds, and calls
+        self.totals = defaultdict(float)
+        self.calls = defaultdict(int)
+        # solver -> seconds spent outside the phases
+        self.own = defaultdict(float)
+        self.visits, self.peak = 0, 0
+        self._solver, self._pid = None, os.getpid()
+        self._start = perf_counter()
+        self._trace = None
+        if trace_path is not None:
+            self._trace = open(trace_path, "w")
+            self._trace.write("[\n")
+        # whether tracemalloc was started here, and should be stopped
+        self._started_memory = memory and not tracemalloc.is_tracing()
+        if self._started_memory:
+            tracemalloc.start()
+
+    def __enter__(self):
+        """
+        Return SearchTracer self, to close when the with block ends.
+
+        @type self: SearchTracer
+        @rtype: SearchTracer
+        """
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        """
+        Close SearchTracer self.
+
+        @type self: SearchTracer
+        @rtype: None
+        """
+        self.close()
+
+    def run(self, solver, puzzle, *args):
+        """
+        Return what solver returns for puzzle and args, tracing the calls
+        it makes on the puzzles it sees.
+
+        The result is a PuzzleNode path, or None, as solver returns it,
+        with the puzzles in it those solver saw.
+
+        @type self: SearchTracer
+        @type solver: function
+        @type puzzle: Puzzle
+        @rtype: PuzzleNode | None
+
+        >>> from puzzle_tools import depth_first_solve
+        >>> from word_ladder_puzzle import WordLadderPuzzle
+        >>> w = WordLadderPuzzle("bill", "tall", {"bill", "bell", "tell",
+        ...                                       "tall"})
+        >>> tracer = SearchTracer(memory=False)
+        >>> node = tracer.run(depth_first_solve, w)
+        >>> type(node.puzzle).__name__, node.puzzle == w
+        ('WordLadderPuzzle', True)
+        >>> tracer.visits, tracer.calls[("depth_first_solve",
+        ...                              "WordLadderPuzzle", "extensions")]
+        (6, 3)
+        """
+        outer, self._solver = self._solver, solver.__name__
+        spent = sum(self.totals.values())
+        start = perf_counter()
+        try:
+            node = solver(_TracedPuzzle(puzzle, self), *args)
+        finally:
+            end = perf_counter()
+            self.own[self._solver] += (end - start -
+                                       (sum(self.totals.values()) - spent))
+            self._event({"name": self._solver, "cat": "search", "ph": "X",
+                         "ts": self._micros(start),
+                         "dur": (end - start) * 1e6,
+                         "args": {"visits": self.visits}})
+            if self.memory:
+                self._allocations()
+            self._solver = outer
+        # the path is of _TracedPuzzles: give it the puzzles they trace
+        path = node
+        while path is not None:
+            if isinstance(path.puzzle, _TracedPuzzle):
+                path.puzzle = path.puzzle.puzzle
+            path = path.children[0] if path.children else None
+        return node
+
+    def time(self, phase, puzzle, function, *args):
+        """
+        Return function(*args), accounting the time it takes to phase for
+        the class of puzzle.
+
+        @type self: SearchTracer
+        @type phase: str
+        @type puzzle: Puzzle
+        @type function: function
+        @rtype: object
+        """
+        return self._time(phase, type(puzzle).__name__, function, *args)
+
+    def visit(self, puzzle):
+        """
+        Count a visit to puzzle, and sample the memory traced, if
+        SearchTracer self traces memory and puzzle is the first of a
+        sample.
+
+        @type self: SearchTracer
+        @type puzzle: Puzzle
+        @rtype: None
+        """
+        self.visits += 1
+        if self.memory and (self.visits % self.sample == 1 or
+                            self.sample == 1):
+            (current, peak) = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            self._event({"name": "memory", "ph": "C",
+                         "ts": self._micros(perf_counter()),
+                         "args": {"traced": current}})
+
+    def close(self):
+        """
+        Finish the trace events of SearchTracer self and write its
+        collapsed stacks.
+
+        @type self: SearchTracer
+        @rtype: None
+        """
+        if self._started_memory:
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            self._started_memory = False
+        if self._trace is not None:
+            self._trace.write(json.dumps({
+                "name": "process_name", "ph": "M", "pid": self._pid,
+                "args": {"name": "puzzle search"}}))
+            self._trace.write("\n]\n")
+            self._trace.close()
+            self._trace = None
+        if self.stacks_path is not None:
+            with open(self.stacks_path, "w") as f:
+                for line in self.stacks():
+                    f.write(line + "\n")
+
+    def stacks(self):
+        """
+        Return the time of each phase of SearchTracer self as collapsed
+        stacks, solver;class;phase followed by microseconds.
+
+        @type self: SearchTracer
+        @rtype: list[str]
+
+        >>> from puzzle_tools import breadth_first_solve
+        >>> from word_ladder_puzzle import WordLadderPuzzle
+        >>> w = WordLadderPuzzle("bill", "tall", {"bill", "bell", "tell",
+        ...                                       "tall"})
+        >>> tracer = SearchTracer(memory=False)
+        >>> node = breadth_first_solve(w, tracer=tracer)
+        >>> for line in tracer.stacks()[:4]:
+        ...     print(line.split()[0])
+        breadth_first_solve
+        breadth_first_solve;WordLadderPuzzle;extensions
+        breadth_first_solve;WordLadderPuzzle;canonical_key
+        breadth_first_solve;WordLadderPuzzle;hash
+        """
+        lines = []
+        for solver in sorted(self.own):
+            lines.append("{} {}".format(solver,
+                                        max(round(self.own[solver] * 1e6), 0)))
+            for (key, seconds) in sorted(
+                    self.totals.items(),
+                    key=lambda item: (item[0][1], PHASES.index(item[0][2]))):
+                if key[0] == solver:
+                    lines.append("{} {}".format(";".join(key),
+                                                round(seconds * 1e6)))
+        return lines
+
+    def _time(self, phase, kind, function, *args):
+        # Return function(*args), accounting the time it takes to phase for
+        # the puzzle class named kind.
+        #
+        # @type self: SearchTracer
+        # @type phase: str
+        # @type kind: str
+        # @type function: function
+        # @rtype: object
+        start = perf_counter()
+        result = function(*args)
+        end = perf_counter()
+        key = (self._solver, kind, phase)
+        self.totals[key] += end - start
+        self.calls[key] += 1
+        if self.calls[key] % self.sample == 1 or self.sample == 1:
+            self._event({"name": phase, "cat": key[1], "ph": "X",
+                         "ts": self._micros(start),
+                         "dur": (end - start) * 1e6,
+                         "args": {"call": self.calls[key]}})
+        return result
+
+    def _micros(self, moment):
+        # Return the microseconds from the start of SearchTracer self to
+        # moment, from perf_counter.
+        #
+        # @type self: SearchTracer
+        # @type moment: float
+        # @rtype: float
+        return (moment - self._start) * 1e6
+
+    def _event(self, event):
+        # Write event to the trace events of SearchTracer self, if it has
+        # any.
+        #
+        # @type self: SearchTracer
+        # @type event: dict
+        # @rtype: None
+        if self._trace is not None:
+            event.setdefault("pid", self._pid)
+            event.setdefault("tid", 0)
+            self._trace.write(json.dumps(event))
+            self._trace.write(",\n")
+
+    def _allocations(self):
+        # Write the ten lines of code holding the most traced memory, as
+        # an instant event at the end of a search.
+        #
+        # @type self: SearchTracer
+        # @rtype: None
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        top = snapshot.statistics("lineno")[:10]
+        self._event({"name": "allocations", "ph": "i", "s": "p",
+                     "ts": self._micros(perf_counter()),
+                     "args": {str(stat.traceback[0]): stat.size
+                              for stat in top}})
+
+
+class _TracedPuzzle:
+    """
+    A Puzzle whose calls from a solver are timed by a SearchTracer.
+
+    Other attributes are those of the puzzle traced, and it pickles as
+    that puzzle, so a checkpointed search saves untraced puzzles.
+    """
+
+    def __init__(self, puzzle, tracer):
+        """
+        Create a new _TracedPuzzle self tracing puzzle with tracer.
+
+        @type self: _TracedPuzzle
+        @type puzzle: Puzzle
+        @type tracer: SearchTracer
+        @rtype: None
+        """
+        self.puzzle, self.tracer = puzzle, tracer
+
+    def __getattr__(self, name):
+        """
+        Return attribute name of the puzzle _TracedPuzzle self traces.
+
+        @type self: _TracedPuzzle
+        @type name: str
+        @rtype: object
+        """
+        return getattr(self.puzzle, name)
+
+    def __reduce__(self):
+        """
+        Return how to pickle _TracedPuzzle self: as its puzzle.
+
+        @type self: _TracedPuzzle
+        @rtype: tuple
+        """
+        return _untraced, (self.puzzle,)
+
+    def __eq__(self, other):
+        """
+        Return whether the puzzle _TracedPuzzle self traces is other, or
+        the puzzle other traces.
+
+        @type self: _TracedPuzzle
+        @type other: Puzzle | _TracedPuzzle
+        @rtype: bool
+        """
+        return self.puzzle == getattr(other, "puzzle", other)
+
+    def __hash__(self):
+        """
+        Return the hash of the puzzle _TracedPuzzle self traces.
+
+        @type self: _TracedPuzzle
+        @rtype: int
+        """
+        return hash(self.puzzle)
+
+    def __str__(self):
+        """
+        Return the puzzle _TracedPuzzle self traces, as a string.
+
+        @type self: _TracedPuzzle
+        @rtype: str
+        """
+        return str(self.puzzle)
+
+    def extensions(self):
+        """
+        Return the extensions of the puzzle _TracedPuzzle self traces,
+        traced.
+
+        @type self: _TracedPuzzle
+        @rtype: list[_TracedPuzzle]
+        """
+        children = self.tracer.time("extensions", self.puzzle, _listed,
+                                    self.puzzle.extensions)
+        return [_TracedPuzzle(child, self.tracer) for child in children]
+
+    def canonical_key(self):
+        """
+        Return the canonical key of the puzzle _TracedPuzzle self traces,
+        wrapped so that hashing and comparing it are timed, and count a
+        visit to the puzzle.
+
+        @type self: _TracedPuzzle
+        @rtype: _TracedKey
+        """
+        self.tracer.visit(self.puzzle)
+        return _TracedKey(self.tracer.time("canonical_key", self.puzzle,
+                                           self.puzzle.canonical_key),
+                          type(self.puzzle).__name__, self.tracer)
+
+    def fail_fast(self):
+        """
+        Return fail_fast of the puzzle _TracedPuzzle self traces.
+
+        @type self: _TracedPuzzle
+        @rtype: bool
+        """
+        return self.tracer.time("fail_fast", self.puzzle,
+                                self.puzzle.fail_fast)
+
+    def is_solved(self):
+        """
+        Return is_solved of the puzzle _TracedPuzzle self traces.
+
+        @type self: _TracedPuzzle
+        @rtype: bool
+        """
+        return self.tracer.time("is_solved", self.puzzle,
+                                self.puzzle.is_solved)
+
+    def heuristic(self):
+        """
+        Return heuristic of the puzzle _TracedPuzzle self traces.
+
+        @type self: _TracedPuzzle
+        @rtype: int
+        """
+        return self.tracer.time("heuristic", self.puzzle,
+                                self.puzzle.heuristic)
+
+
+class _TracedKey:
+    """
+    A canonical key whose hashing and comparisons are timed by a
+    SearchTracer.  It pickles as the key, and equals it.
+
+    Solvers keep every key they see, so it holds only the name of the
+    puzzle class, not the puzzle, and the tracer shared by all keys.
+    """
+    __slots__ = ("key", "kind", "tracer")
+
+    def __init__(self, key, kind, tracer):
+        """
+        Create a new _TracedKey self for key, the canonical key of a
+        puzzle of the class named kind, timed by tracer.
+
+        @type self: _TracedKey
+        @type key: Hashable
+        @type kind: str
+        @type tracer: SearchTracer
+        @rtype: None
+        """
+        self.key, self.kind, self.tracer = key, kind, tracer
+
+    def __reduce__(self):
+        """
+        Return how to pickle _TracedKey self: as its key.
+
+        @type self: _TracedKey
+        @rtype: tuple
+        """
+        return _untraced, (self.key,)
+
+    def __hash__(self):
+        """
+        Return the hash of the key of _TracedKey self.
+
+        @type self: _TracedKey
+        @rtype: int
+        """
+        return self.tracer._time("hash", self.kind, hash, self.key)
+
+    def __eq__(self, other):
+        """
+        Return whether the key of _TracedKey self equals other, or the
+        key of other.
+
+        @type self: _TracedKey
+        @type other: Hashable
+        @rtype: bool
+        """
+        if isinstance(other, _TracedKey):
+            other = other.key
+        return self.tracer._time("dedup", self.kind, _equal, self.key,
+                                 other)
+
+
+def _untraced(item):
+    # Return item, the puzzle or key a pickled traced one was made of.
+    #
+    # @type item: object
+    # @rtype: object
+    return item
+
+
+def _listed(extensions):
+    # Return the extensions of a puzzle, from its extensions method, as a
+    # list, so that generators are timed while they run.
+    #
+    # @type extensions: function
+    # @rtype: list[Puzzle]
+    return list(extensions())
+
+
+def _equal(key, other):
+    # Return whether key equals other.
+    #
+    # @type key: Hashable
+    # @type other: Hashable
+    # @rtype: bool
+    return key == other
+
+
+if __name__ == "__main__":
+    import doctest
+    import sys
+    doctest.testmod()
+    from mn_puzzle import MNPuzzle
+    from puzzle_tools import breadth_first_solve
+    target = MNPuzzle((("8", "1", "3"), ("4", "*", "2"), ("7", "6", "5")),
+                      (("1", "2", "3"), ("4", "5", "6"), ("7", "8", "*")))
+    with SearchTracer("search.trace.json", "search.stacks") as tracer:
+        breadth_first_solve(target, tracer=tracer)
+    print("{} states visited, {} bytes traced at most; wrote "
+          "search.trace.json and search.stacks".format(tracer.visits,
+                                                       tracer.peak),
+          file=sys.stderr)
+    for line in tracer.stacks():
+        print(line)
@@ -0,0 +1,358 @@
+"""
+Solve a puzzle read from a text file or standard input.
+
+    python -m solve KIND [FILE] [--engine ENGINE] [--workers N]
+                    [--nodes N] [--seconds S] [--json]
+
+KIND is the kind of puzzle FILE holds (standard input if FILE is "-" or
+missing), written as:
+
+    word    the from and to words, separated by whitespace; the words
+            allowed are read from --words, words.graph or words
+    peg     the rows of the grid, with "*" for pegs, "." for holes and
+            "#" for cells off the board
+    mn      the rows of the grid, with "*" for the space and symbols
+            separated by spaces if any is longer than one character,
+            then a blank line and the rows of the goal grid; the goal
+            is the symbols in order with "*" last if it is left out
+    sudoku  the n * n positions, row by row, with "." or "*" for empty
+            positions, as in sudoku_stream
+
+ENGINE is dfs, bfs, astar or parallel.  The path to the solution is
+printed, one puzzle after another, followed by the number of puzzles
+expanded, the peak memory of the process and the time taken, or all of
+these as one JSON object with --json.  The exit status is 0 if a
+solution was found, 1 if there is none, and 3 if the search ran out of
+its --nodes or --seconds budget first.
+"""
+import argparse
+import json
+import os
+import sys
+from time import perf_counter
+from grid_peg_solitaire_puzzle import GridPegSolitairePuzzle
+from mn_puzzle import MNPuzzle
+from parallel_solve import parallel_depth_first_solve
+from puzzle_tools import a_star_solve, breadth_first_solve, depth_first_solve
+from search_trace import SearchTracer
+from sudoku_stream import parse_sudoku_line
+from word_ladder_puzzle import WordLadderPuzzle
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+KINDS = ("word", "peg", "mn", "sudoku")
+# engine -> the solver it runs in this process, or None for parallel
+ENGINES = {"dfs": depth_first_solve, "bfs": breadth_first_solve,
+           "astar": a_star_solve, "parallel": None}
+# where the word lists are looked for by default
+_HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class BudgetExceeded(Exception):
+    """
+    Raised when a search runs out of its budget of puzzles or time.
+    """
+    pass
+
+
+class _Budget:
+    """
+    Counts the puzzles a search expands, and stops it once it runs out
+    of its budget of puzzles or time.
+    """
+
+    def __init__(self, nodes=None, seconds=None):
+        """
+        Create a new _Budget self for a search that may expand nodes
+        puzzles and take seconds, each if it is not None.
+
+        @type self: _Budget
+        @type nodes: int | None
+        @type seconds: float | None
+        @rtype: None
+        """
+        self.nodes, self.seconds, self.expanded = nodes, seconds, 0
+        self._deadline = (None if seconds is None else
+                          perf_counter() + seconds)
+
+    def __call__(self):
+        """
+        Count one more puzzle expanded under _Budget self, or raise
+        BudgetExceeded if it is past the budget of self.
+
+        @type self: _Budget
+        @rtype: None
+        """
+        if self.nodes is not None and self.expanded >= self.nodes:
+            raise BudgetExceeded("expanded {} puzzles without a "
+                                 "solution".format(self.nodes))
+        if self._deadline is not None and perf_counter() > self._deadline:
+            raise BudgetExceeded("found no solution in {} seconds".format(
+                self.seconds))
+        self.expanded += 1
+
+
+def load_puzzle(kind, text, words=None):
+    """
+    Return the puzzle of kind written in text, as described above, or
+    raise ValueError saying why text does not hold one.
+
+    @type kind: str
+    @type text: str
+    @type words: str | None
+    @rtype: Puzzle
+
+    >>> print(load_puzzle("mn", "*23\\n145"))
+    *23
+    145
+    >>> load_puzzle("mn", "*23\\n145").to_grid
+    (('1', '2', '3'), ('4', '5', '*'))
+    >>> print(load_puzzle("peg", "**.*\\n"))
+    **.*
+    >>> load_puzzle("peg", "**x*")
+    Traceback (most recent call last):
+    ...
+    ValueError: a peg grid may only hold "*", "." and "#"
+    """
+    if kind == "sudoku":
+        return parse_sudoku_line("".join(text.split()))
+    if kind == "word":
+        ends = text.split()
+        if len(ends) != 2:
+            raise ValueError("expected a from word and a to word")
+        return WordLadderPuzzle(ends[0], ends[1], _load_words(words))
+    lines = [line.strip() for line in text.strip().splitlines()]
+    if kind == "peg":
+        grid = [list(line) for line in lines if line]
+        if not grid or any([len(row) != len(grid[0]) for row in grid]):
+            raise ValueError("a peg grid needs rows of one length")
+        if any([c not in "*.#" for row in grid for c in row]):
+            raise ValueError('a peg grid may only hold "*", "." and "#"')
+        return GridPegSolitairePuzzle(grid, {"*", ".", "#"})
+    if kind == "mn":
+        if "" in lines:
+            blank = lines.index("")
+            (start, goal) = (_mn_grid(lines[:blank]),
+                             _mn_grid([line for line in lines[blank:]
+                                       if line]))
+        else:
+            start = _mn_grid(lines)
+            goal = _mn_goal(start)
+        if (len(goal), len(goal[0])) != (len(start), len(start[0])) or (
+                sorted(sum(goal, ())) != sorted(sum(start, ()))):
+            raise ValueError("the goal grid does not hold the symbols of "
+                             "the start grid")
+        return MNPuzzle(start, goal)
+    raise ValueError("{!r} is not one of {}".format(kind, ", ".join(KINDS)))
+
+
+def _load_words(path):
+    # Return the words allowed in a word ladder, from the word graph or
+    # list at path, or from words.graph or words next to this module if
+    # path is None.
+    #
+    # @type path: str | None
+    # @rtype: set[str] | WordGraph
+    if path is None:
+        path = os.path.join(_HERE, "words.graph")
+        if not os.path.exists(path):
+            path = os.path.join(_HERE, "words")
+    if path.endswith(".graph"):
+        from word_graph import WordGraph
+        return WordGraph(path)
+    with open(path) as f:
+        return set(f.read().split())
+
+
+def _mn_grid(lines):
+    # Return the grid of an MNPuzzle written on lines, or raise
+    # ValueError if its rows are not all of one length.
+    #
+    # @type lines: list[str]
+    # @rtype: tuple[tuple[str]]
+    grid = tuple([tuple(line.split() if " " in line or "\t" in line
+                        else line) for line in lines])
+    if not grid or any([len(row) != len(grid[0]) for row in grid]):
+        raise ValueError("an mn grid needs rows of one length")
+    if sum(grid, ()).count("*") != 1:
+        raise ValueError('an mn grid needs exactly one "*"')
+    return grid
+
+
+def _mn_goal(grid):
+    # Return the goal for an MNPuzzle starting at grid: its symbols in
+    # order, numerically if they are all numbers, with "*" last.
+    #
+    # @type grid: tuple[tuple[str]]
+    # @rtype: tuple[tuple[str]]
+    symbols = [symbol for row in grid for symbol in row if symbol != "*"]
+    if all([symbol.isdigit() for symbol in symbols]):
+        symbols.sort(key=int)
+    else:
+        symbols.sort()
+    symbols.append("*")
+    m = len(grid[0])
+    return tuple([tuple(symbols[r:r + m])
+                  for r in range(0, len(symbols), m)])
+
+
+def run(puzzle, engine="bfs", workers=None, nodes=None, seconds=None,
+        trace_path=None, stacks_path=None):
+    """
+    Return a report of solving puzzle with engine, in at most seconds
+    and, unless engine is parallel, expanding at most nodes puzzles, and
+    writing a trace to trace_path and stacks_path as SearchTracer does,
+    each if it is not None.
+
+    The report has the status of the search ("solved", "unsolvable" or
+    "budget exceeded", with a message saying which), the path to the
+    solution as a list of puzzles, the number of puzzles expanded, the
+    peak memory in bytes and the seconds taken.  The number of puzzles
+    expanded is None for the parallel engine, whose workers do not
+    count them, and the peak memory is None where it is not known.
+
+    @type puzzle: Puzzle
+    @type engine: str
+    @type workers: int | None
+    @type nodes: int | None
+    @type seconds: float | None
+    @type trace_path: str | None
+    @type stacks_path: str | None
+    @rtype: dict[str, object]
+
+    >>> m = load_puzzle("mn", "*23\\n145")
+    >>> report = run(m, "astar")
+    >>> report["status"], len(report["path"]) - 1, report["nodes_expanded"]
+    ('solved', 3, 3)
+    >>> report = run(m, "dfs", nodes=2)
+    >>> report["status"], report["message"], report["path"]
+    ('budget exceeded', 'expanded 2 puzzles without a solution', None)
+    """
+    report = {"status": None, "message": None, "path": None,
+              "nodes_expanded": None, "peak_memory_bytes": None,
+              "elapsed_seconds": None}
+    budget = None
+    start = perf_counter()
+    try:
+        if engine == "parallel":
+            node = parallel_depth_first_solve(puzzle, workers,
+                                              timeout=seconds)
+        else:
+            budget, tracer = _Budget(nodes, seconds), None
+            if trace_path is not None or stacks_path is not None:
+                tracer = SearchTracer(trace_path, stacks_path,
+                                      memory=trace_path is not None)
+            try:
+                node = ENGINES[engine](puzzle, tracer=tracer, budget=budget)
+            finally:
+                # not counting the time to finish writing the trace
+                report["elapsed_seconds"] = perf_counter() - start
+                if tracer is not None:
+                    tracer.close()
+    except (BudgetExceeded, TimeoutError) as error:
+        (report["status"], report["message"]) = ("budget exceeded",
+                                                 str(error))
+    else:
+        report["status"] = "unsolvable" if node is None else "solved"
+        if node is not None:
+            report["path"] = [node.puzzle]
+            while node.children:
+                node = node.children[0]
+                report["path"].append(node.puzzle)
+    if report["elapsed_seconds"] is None:
+        report["elapsed_seconds"] = perf_counter() - start
+    if budget is not None:
+        report["nodes_expanded"] = budget.expanded
+    report["peak_memory_bytes"] = _peak_memory()
+    return report
+
+
+def _peak_memory():
+    # Return the largest resident memory, in bytes, of this process and
+    # of any worker processes it waited for, or None if it is not known.
+    #
+    # @rtype: int | None
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    # kilobytes, except on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def main(argv=None):
+    """
+    Solve the puzzle described by the command line argv, as described
+    above, and return the exit status.
+
+    @type argv: list[str] | None
+    @rtype: int
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m solve",
+        description="Solve a puzzle read from a file or standard input.")
+    parser.add_argument("kind", choices=KINDS)
+    parser.add_argument("file", nargs="?", default="-",
+                        help='file holding the puzzle, or "-" for standard '
+                             'input (the default)')
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="bfs")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes of the parallel engine (all cores "
+                             "by default)")
+    parser.add_argument("--nodes", type=int, default=None,
+                        help="give up after expanding this many puzzles")
+    parser.add_argument("--seconds", type=float, default=None,
+                        help="give up after this many seconds")
+    parser.add_argument("--words", default=None,
+                        help="word list, or word graph ending in .graph, "
+                             "for word ladders")
+    parser.add_argument("--trace", default=None,
+                        help="write Chrome trace events here")
+    parser.add_argument("--stacks", default=None,
+                        help="write collapsed stacks for flamegraphs here")
+    parser.add_argument("--json", action="store_true",
+                        help="print the report as JSON")
+    args = parser.parse_args(argv)
+    if args.engine == "parallel" and (args.nodes is not None or
+                                      args.trace is not None or
+                                      args.stacks is not None):
+        parser.error("--nodes, --trace and --stacks are not supported by "
+                     "the parallel engine")
+    if args.file == "-":
+        text = sys.stdin.read()
+    else:
+        with open(args.file) as f:
+            text = f.read()
+    try:
+        puzzle = load_puzzle(args.kind, text, args.words)
+    except ValueError as error:
+        parser.error("{}: {}".format(args.file, error))
+    report = run(puzzle, args.engine, args.workers, args.nodes, args.seconds,
+                 args.trace, args.stacks)
+    path = report["path"]
+    if args.json:
+        report = dict(report, kind=args.kind, engine=args.engine,
+                      moves=None if path is None else len(path) - 1,
+                      path=None if path is None else [str(p) for p in path])
+        print(json.dumps(report, indent=2))
+    else:
+        if path is not None:
+            print("\n\n".join([str(p) for p in path]))
+            print()
+            print("moves: {}".format(len(path) - 1))
+        else:
+            print(report["message"] or "no solution")
+        expanded = report["nodes_expanded"]
+        print("puzzles expanded: {}".format(
+            "unknown" if expanded is None else expanded))
+        print("peak memory: {}".format(
+            "unknown" if report["peak_memory_bytes"] is None else
+            "{:.1f} MiB".format(report["peak_memory_bytes"] / 2 ** 20)))
+        print("elapsed: {:.3f} seconds".format(report["elapsed_seconds"]))
+    return {"solved": 0, "unsolvable": 1}.get(report["status"], 3)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
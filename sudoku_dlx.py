@@ -0,0 +1,305 @@
+"""
+Solve SudokuPuzzles as exact cover problems with Dancing Links.
+"""
+from itertools import islice
+from puzzle_tools import create_puzzlenode, PuzzleNode
+from sudoku_puzzle import SudokuPuzzle
+
+
+class _SudokuCover:
+    """
+    The exact cover problem left by the empty positions of a
+    SudokuPuzzle, as Knuth's toroidal linked matrix.
+
+    Columns are the constraints the given symbols do not satisfy yet:
+    each empty position holds one symbol, and each row, column and
+    subsquare holds each symbol it is missing once.  Rows are the
+    (position, symbol) choices allowed by the given symbols.  Nodes are
+    indices into flat lists of links rather than objects, with node 0
+    the root and nodes 1 to the number of columns their headers.
+    """
+
+    def __init__(self, puzzle):
+        """
+        Create a new _SudokuCover self for the empty positions of puzzle.
+
+        @type self: _SudokuCover
+        @type puzzle: SudokuPuzzle
+        @rtype: None
+        """
+        (cells, rows, columns, subsquares) = puzzle.masks()
+        n = puzzle.n
+        self.puzzle = puzzle
+        # given symbols that repeat in a row, column or subsquare leave
+        # fewer bits in its mask than there are given symbols
+        given = len([bit for bit in cells if bit])
+        self.consistent = all([
+            sum([bin(mask).count("1") for mask in masks]) == given
+            for masks in (rows, columns, subsquares)])
+        # constraint -> column header, for constraints still to satisfy
+        header = {}
+        for m in range(n * n):
+            if cells[m] == 0:
+                header[("position", m)] = len(header) + 1
+        for (kind, masks) in (("row", rows), ("column", columns),
+                              ("subsquare", subsquares)):
+            for (unit, mask) in enumerate(masks):
+                for i in range(n):
+                    if not mask >> i & 1:
+                        header[(kind, unit, i)] = len(header) + 1
+        count = len(header)
+        # left, right, up and down links, column header and size of
+        # each column, and (position, bit) of each node's row
+        self.left = [count] + list(range(count))
+        self.right = list(range(1, count + 1)) + [0]
+        self.up = list(range(count + 1))
+        self.down = list(range(count + 1))
+        self.column = list(range(count + 1))
+        self.size = [0] * (count + 1)
+        self.choice = [None] * (count + 1)
+        for m in range(n * n):
+            if cells[m] == 0:
+                allowed = puzzle.allowed(m)
+                (row, column, subsquare) = puzzle.units_of(m)
+                for i in range(n):
+                    if allowed >> i & 1:
+                        self._add_row((m, 1 << i), [header[key] for key in (
+                            ("position", m), ("row", row, i),
+                            ("column", column, i),
+                            ("subsquare", subsquare, i))])
+
+    def _add_row(self, choice, columns):
+        # Append a row for choice with a node in each of columns, at the
+        # bottom of each.
+        #
+        # @type self: _SudokuCover
+        # @type choice: (int, int)
+        # @type columns: list[int]
+        # @rtype: None
+        first = len(self.column)
+        for (k, c) in enumerate(columns):
+            node = first + k
+            self.left.append(first + (k - 1) % len(columns))
+            self.right.append(first + (k + 1) % len(columns))
+            self.up.append(self.up[c])
+            self.down.append(c)
+            self.down[self.up[c]] = node
+            self.up[c] = node
+            self.column.append(c)
+            self.choice.append(choice)
+            self.size[c] += 1
+
+    def solutions(self):
+        """
+        Yield the choices of each exact cover of _SudokuCover self, as a
+        list of (position, symbol bit) in the order they were chosen.
+
+        The search is iterative, so its depth is not limited by the
+        recursion limit, and each branch covers the column with the
+        fewest rows left.
+
+        @type self: _SudokuCover
+        @rtype: generator[list[(int, int)]]
+
+        >>> grid = ["A", "B", "C", "D"]
+        >>> grid += ["C", "D", "A", "B"]
+        >>> grid += ["B", "A", "D", "C"]
+        >>> grid += ["D", "C", "*", "*"]
+        >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+        >>> sorted(list(_SudokuCover(s).solutions())[0])
+        [(14, 2), (15, 1)]
+        >>> grid = ["A", "B", "*", "*"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+        >>> solutions = list(_SudokuCover(s).solutions())
+        >>> len(solutions), len(set([tuple(sorted(c)) for c in solutions]))
+        (24, 24)
+        """
+        if not self.consistent:
+            return
+        left, right, up, down = self.left, self.right, self.up, self.down
+        column, size = self.column, self.size
+
+        def cover(c):
+            right[left[c]], left[right[c]] = right[c], left[c]
+            i = down[c]
+            while i != c:
+                j = right[i]
+                while j != i:
+                    down[up[j]], up[down[j]] = down[j], up[j]
+                    size[column[j]] -= 1
+                    j = right[j]
+                i = down[i]
+
+        def uncover(c):
+            i = up[c]
+            while i != c:
+                j = left[i]
+                while j != i:
+                    size[column[j]] += 1
+                    down[up[j]] = up[down[j]] = j
+                    j = left[j]
+                i = up[i]
+            right[left[c]] = c
+            left[right[c]] = c
+
+        # the node of the row chosen at each level of the search
+        rows = []
+        while True:
+            if right[0] == 0:
+                yield [self.choice[r] for r in rows]
+                node = None
+            else:
+                # column with the fewest rows left
+                c, best = right[0], size[right[0]]
+                j = right[c]
+                while j != 0 and best > 1:
+                    if size[j] < best:
+                        c, best = j, size[j]
+                    j = right[j]
+                cover(c)
+                node = down[c]
+            # try node, or backtrack past every level with no rows left
+            while node is None or node == column[node]:
+                if node is not None:
+                    uncover(node)
+                if not rows:
+                    return
+                node = rows.pop()
+                j = left[node]
+                while j != node:
+                    uncover(column[j])
+                    j = left[j]
+                node = down[node]
+            rows.append(node)
+            j = right[node]
+            while j != node:
+                cover(column[j])
+                j = right[j]
+
+
+def _solved(puzzle, choices):
+    # Return the SudokuPuzzle that puzzle becomes after choices.
+    #
+    # @type puzzle: SudokuPuzzle
+    # @type choices: list[(int, int)]
+    # @rtype: SudokuPuzzle
+    for (m, bit) in choices:
+        puzzle = puzzle.place(m, bit)
+    return puzzle
+
+
+def dlx_solve(puzzle):
+    """
+    Return a path from PuzzleNode(puzzle) to a PuzzleNode containing a
+    solution, as depth_first_solve does, with each child placing one
+    more symbol in its parent's empty positions, in the order Dancing
+    Links chose them.  Return None if this is not possible.
+
+    @type puzzle: SudokuPuzzle
+    @rtype: PuzzleNode | None
+
+    >>> grid = ["A", "B", "C", "D"]
+    >>> grid += ["C", "D", "A", "B"]
+    >>> grid += ["B", "A", "*", "*"]
+    >>> grid += ["D", "C", "*", "*"]
+    >>> node = dlx_solve(SudokuPuzzle(4, grid, {"A", "B", "C", "D"}))
+    >>> depth = 0
+    >>> while node.children:
+    ...     node, depth = node.children[0], depth + 1
+    >>> depth, node.puzzle.is_solved()
+    (4, True)
+    >>> grid[10] = "A"
+    >>> dlx_solve(SudokuPuzzle(4, grid, {"A", "B", "C", "D"})) is None
+    True
+    """
+    for choices in _SudokuCover(puzzle).solutions():
+        # each state is the one before it with one more symbol placed
+        puzzles = [puzzle]
+        for (m, bit) in choices:
+            puzzles.append(puzzles[-1].place(m, bit))
+        node = PuzzleNode(puzzles[-1])
+        for state in reversed(puzzles[:-1]):
+            node = create_puzzlenode(state, node)
+        return node
+    return None
+
+
+def dlx_count(puzzle, k=None):
+    """
+    Return the number of solutions of puzzle, counting no further than k
+    if k is not None.
+
+    @type puzzle: SudokuPuzzle
+    @type k: int | None
+    @rtype: int
+
+    >>> grid = ["A", "B", "*", "*"]
+    >>> grid += ["*", "*", "*", "*"]
+    >>> grid += ["*", "*", "*", "*"]
+    >>> grid += ["*", "*", "*", "*"]
+    >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+    >>> dlx_count(s)
+    24
+    >>> dlx_count(s, 2)
+    2
+    """
+    return len(list(islice(_SudokuCover(puzzle).solutions(), k)))
+
+
+def dlx_solutions(puzzle, k=None):
+    """
+    Return the solved SudokuPuzzles that puzzle can be completed to, all
+    of them, or at most k if k is not None.
+
+    @type puzzle: SudokuPuzzle
+    @type k: int | None
+    @rtype: list[SudokuPuzzle]
+
+    >>> grid = ["A", "*", "*", "*"]
+    >>> grid += ["*", "*", "A", "*"]
+    >>> grid += ["*", "A", "*", "*"]
+    >>> grid += ["*", "*", "*", "A"]
+    >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+    >>> solutions = dlx_solutions(s)
+    >>> len(solutions), all([t.is_solved() for t in solutions])
+    (18, True)
+    >>> len(dlx_solutions(s, 1))
+    1
+    """
+    return [_solved(puzzle, choices)
+            for choices in islice(_SudokuCover(puzzle).solutions(), k)]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    from random import Random
+    from time import time
+    random = Random(2015)
+    for (n, symbols, empty) in ((9, "123456789", 0.75),
+                                (16, "0123456789ABCDEF", 0.5),
+                                (25, "ABCDEFGHIJKLMNOPQRSTUVWXY", 0.45)):
+        # a shuffled pattern solution, with some of its positions emptied
+        r = round(n ** (1 / 2))
+        grid = [symbols[(r * (i % r) + i // r + j) % n]
+                for i in range(n) for j in range(n)]
+        renamed = dict(zip(symbols, random.sample(symbols, n)))
+        grid = [renamed[d] for d in grid]
+        for m in random.sample(range(n * n), round(empty * n * n)):
+            grid[m] = "*"
+        s = SudokuPuzzle(n, grid, set(symbols))
+        start = time()
+        solution = dlx_solve(s)
+        end = time()
+        while solution.children:
+            solution = solution.children[0]
+        print("Solved {0}x{0} with {1} empty positions in {2} seconds using "
+              "dancing links.".format(n, grid.count("*"), end - start))
+        start = time()
+        count = dlx_count(s, 2)
+        end = time()
+        print("Counted {} solutions, up to 2, in {} seconds.".format(
+            count, end - start))
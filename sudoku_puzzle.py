@@ -1,27 +1,364 @@
 from puzzle import Puzzle
+from grid_symmetry import grid_transforms
+from puzzle_codec import (context_fingerprint, lookup_context, pack,
+                          register_class, register_context, unpack)
+
+# n -> rotations and reflections of an nxn grid
+_transforms = {}
+# (n, symbols) -> shared _SudokuGrid
+_grids = {}
+# puzzle_codec tag of SudokuPuzzle states
+_TAG = 4
+
+
+class _SudokuGrid:
+    """
+    Layout shared by every SudokuPuzzle with the same n and symbols.
+
+    Each symbol is a bit of an int, in sorted order, so a set of symbols
+    is a mask and the empty position "*" is 0.
+    """
+
+    def __init__(self, n, symbols):
+        """
+        Create a new _SudokuGrid self for nxn puzzles over symbols.
+
+        @type self: _SudokuGrid
+        @type n: int
+        @type symbols: tuple[str]
+        @rtype: None
+        """
+        self.n, self.symbols = n, symbols
+        self.fingerprint = context_fingerprint("sudoku", n, symbols)
+        self.bits = {symbol: 1 << i for (i, symbol) in enumerate(symbols)}
+        self.bits["*"] = 0
+        self.names = {bit: symbol for (symbol, bit) in self.bits.items()}
+        self.full = (1 << n) - 1
+        ss = round(n ** (1 / 2))
+        # row, column and subsquare of each position
+        self.row = [m // n for m in range(n * n)]
+        self.column = [m % n for m in range(n * n)]
+        self.subsquare = [(m // n // ss) * ss + (m % n) // ss
+                          for m in range(n * n)]
+        # other positions sharing a row, column or subsquare with each
+        self.peers = [tuple([p for p in range(n * n) if p != m and (
+            self.row[p] == self.row[m] or
+            self.column[p] == self.column[m] or
+            self.subsquare[p] == self.subsquare[m])]) for m in range(n * n)]
+        # positions of each row, column and subsquare
+        self.units = [tuple([p for p in range(n * n) if of[p] == i])
+                      for of in (self.row, self.column, self.subsquare)
+                      for i in range(n)]
+
+    def __reduce__(self):
+        """
+        Return how to pickle _SudokuGrid self, so that it is shared again
+        when unpickled.
+
+        @type self: _SudokuGrid
+        @rtype: tuple
+        """
+        return _sudoku_grid, (self.n, self.symbols)
+
+
+def _sudoku_grid(n, symbols):
+    # Return the shared _SudokuGrid for nxn puzzles over symbols.
+    #
+    # @type n: int
+    # @type symbols: iterable[str]
+    # @rtype: _SudokuGrid
+    key = (n, tuple(sorted(symbols)))
+    if key not in _grids:
+        _grids[key] = _SudokuGrid(*key)
+    return _grids[key]
+
+
+def least_constraining_value(puzzle, m, candidates):
+    """
+    Return candidates, the symbols that may go at position m of puzzle,
+    ordered so that those ruling out the fewest choices at the empty
+    positions sharing a row, column or subsquare with m come first.
+
+    Pass this as the value_order of a SudokuPuzzle to try its symbols in
+    this order.
+
+    @type puzzle: SudokuPuzzle
+    @type m: int
+    @type candidates: list[str]
+    @rtype: list[str]
+
+    >>> grid = ["A", "*", "*", "*"]
+    >>> grid += ["*", "*", "*", "*"]
+    >>> grid += ["*", "*", "*", "*"]
+    >>> grid += ["*", "*", "*", "*"]
+    >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+    >>> least_constraining_value(s, 5, ["B", "C", "D"])
+    ['B', 'C', 'D']
+    >>> least_constraining_value(s, 15, ["A", "B", "C", "D"])
+    ['A', 'B', 'C', 'D']
+    """
+    grid, cells = puzzle._grid, puzzle._cells
+    # candidate masks of the empty peers of m
+    masks = [puzzle._allowed(p) for p in grid.peers[m] if cells[p] == 0]
+    return sorted(candidates, key=lambda symbol: len(
+        [mask for mask in masks if mask & grid.bits[symbol]]))
 
 
 class SudokuPuzzle(Puzzle):
     """
     A sudoku puzzle that may be solved, unsolved, or even unsolvable.
+
+    Positions hold symbol bits (0 for "*"), and each row, column and
+    subsquare keeps the mask of symbols already used in it, so the
+    symbols allowed at a position are one AND/NOT away.  Each empty
+    position also keeps its number of allowed symbols and of empty
+    positions sharing a row, column or subsquare with it, so extensions
+    can branch on the most constrained position.
     """
 
-    def __init__(self, n, symbols, symbol_set):
+    def __init__(self, n, symbols, symbol_set, value_order=None):
         """
         Create a new nxn SudokuPuzzle self with symbols
         from symbol_set already selected.
 
+        Extensions try the symbols allowed at a position in sorted order,
+        or in the order returned by value_order(puzzle, position,
+        symbols), such as least_constraining_value.
+
         @type self: SudokuPuzzle
         @type n: int
         @type symbols: list[str]
         @type symbol_set: set[str]
+        @type value_order: function | None
         """
         assert n > 0
         assert round(n ** (1 / 2)) * round(n ** (1 / 2)) == n
         assert all([d in (symbol_set | {"*"}) for d in symbols])
         assert len(symbol_set) == n
         assert len(symbols) == n ** 2
-        self._n, self._symbols, self._symbol_set = n, symbols, symbol_set
+        self._n, self._symbol_set = n, symbol_set
+        self._value_order = value_order
+        self._grid = grid = _sudoku_grid(n, symbol_set)
+        self._cells = cells = [grid.bits[d] for d in symbols]
+        (self._rows, self._columns, self._subsquares) = ([0] * n, [0] * n,
+                                                         [0] * n)
+        for (m, bit) in enumerate(cells):
+            self._rows[grid.row[m]] |= bit
+            self._columns[grid.column[m]] |= bit
+            self._subsquares[grid.subsquare[m]] |= bit
+        # number of allowed symbols at each empty position, and n + 1,
+        # more than any empty position can have, at the others
+        self._counts = [bin(self._allowed(m)).count("1") if bit == 0
+                        else n + 1 for (m, bit) in enumerate(cells)]
+        # number of empty positions sharing a row, column or subsquare
+        # with each position
+        self._degrees = [len([p for p in grid.peers[m] if cells[p] == 0])
+                         for m in range(len(cells))]
+        # whether propagation found a symbol with no place in some row,
+        # column or subsquare
+        self._stuck = False
+
+    def _child(self, m, bit):
+        # Return a copy of SudokuPuzzle self with symbol bit placed at
+        # position m.
+        #
+        # @type self: SudokuPuzzle
+        # @type m: int
+        # @type bit: int
+        # @rtype: SudokuPuzzle
+        child = SudokuPuzzle.__new__(SudokuPuzzle)
+        (child._n, child._symbol_set, child._grid, child._value_order,
+         child._stuck) = (self._n, self._symbol_set, self._grid,
+                          self._value_order, self._stuck)
+        child._cells = self._cells[:]
+        child._counts, child._degrees = self._counts[:], self._degrees[:]
+        (child._rows, child._columns, child._subsquares) = (
+            self._rows[:], self._columns[:], self._subsquares[:])
+        child._place(m, bit)
+        return child
+
+    def _place(self, m, bit):
+        # Place symbol bit at empty position m of SudokuPuzzle self,
+        # updating only the masks of m's row, column and subsquare, and
+        # the counts of the positions sharing them.
+        #
+        # @type self: SudokuPuzzle
+        # @type m: int
+        # @type bit: int
+        # @rtype: None
+        grid, cells, counts, degrees = (self._grid, self._cells,
+                                        self._counts, self._degrees)
+        (rows, columns, subsquares) = (self._rows, self._columns,
+                                       self._subsquares)
+        cells[m], counts[m] = bit, self._n + 1
+        for p in grid.peers[m]:
+            degrees[p] -= 1
+            # bit is no longer allowed at p, if it was before
+            if cells[p] == 0 and not bit & (rows[grid.row[p]] |
+                                            columns[grid.column[p]] |
+                                            subsquares[grid.subsquare[p]]):
+                counts[p] -= 1
+        rows[grid.row[m]] |= bit
+        columns[grid.column[m]] |= bit
+        subsquares[grid.subsquare[m]] |= bit
+
+    def _propagate(self):
+        # Fill in the positions of SudokuPuzzle self that are forced:
+        # those with one allowed symbol (naked singles), and those that
+        # are the only place for a symbol in their row, column or
+        # subsquare (hidden singles), until none are left or a
+        # contradiction shows up for fail_fast.
+        #
+        # @type self: SudokuPuzzle
+        # @rtype: None
+        grid, cells, counts, full = (self._grid, self._cells, self._counts,
+                                     self._grid.full)
+        changed = True
+        while changed and not self._stuck:
+            changed = False
+            while 1 in counts and 0 not in counts:
+                m = counts.index(1)
+                self._place(m, self._allowed(m))
+            if 0 in counts:
+                return
+            for unit in grid.units:
+                # symbols allowed somewhere in unit, at least twice, and
+                # already used
+                once = twice = used = 0
+                for p in unit:
+                    if cells[p] == 0:
+                        allowed = self._allowed(p)
+                        twice |= once & allowed
+                        once |= allowed
+                    else:
+                        used |= cells[p]
+                if once | used != full:
+                    self._stuck = True
+                    return
+                singles = once & ~twice
+                if singles:
+                    for p in unit:
+                        bit = cells[p] == 0 and self._allowed(p) & singles
+                        if bit & (bit - 1):
+                            # the only place for two symbols
+                            self._stuck = True
+                            return
+                        elif bit:
+                            self._place(p, bit)
+                    changed = True
+                    break
+
+    def _allowed(self, m):
+        # Return the mask of symbols that may go at position m.
+        #
+        # @type self: SudokuPuzzle
+        # @type m: int
+        # @rtype: int
+        grid = self._grid
+        return grid.full & ~(self._rows[grid.row[m]] |
+                             self._columns[grid.column[m]] |
+                             self._subsquares[grid.subsquare[m]])
+
+    @property
+    def n(self):
+        """
+        Return the number of rows, columns and symbols of SudokuPuzzle
+        self.
+
+        @type self: SudokuPuzzle
+        @rtype: int
+        """
+        return self._n
+
+    def masks(self):
+        """
+        Return the symbol at each position of SudokuPuzzle self, and the
+        symbols used in each row, column and subsquare, with symbols as
+        bits: symbol i in sorted order is 1 << i, and a position that is
+        "*" is 0.  The lists are copies.
+
+        @type self: SudokuPuzzle
+        @rtype: (list[int], list[int], list[int], list[int])
+
+        >>> s = SudokuPuzzle(4, ["B"] + ["*"] * 15, {"A", "B", "C", "D"})
+        >>> (cells, rows, columns, subsquares) = s.masks()
+        >>> cells[:2], rows, columns[0], subsquares[0]
+        ([2, 0], [2, 0, 0, 0], 2, 2)
+        """
+        return (self._cells[:], self._rows[:], self._columns[:],
+                self._subsquares[:])
+
+    def units_of(self, m):
+        """
+        Return the row, column and subsquare of position m of
+        SudokuPuzzle self, as indices into the lists of masks.
+
+        @type self: SudokuPuzzle
+        @type m: int
+        @rtype: (int, int, int)
+
+        >>> SudokuPuzzle(4, ["*"] * 16, {"A", "B", "C", "D"}).units_of(7)
+        (1, 3, 1)
+        """
+        grid = self._grid
+        return grid.row[m], grid.column[m], grid.subsquare[m]
+
+    def allowed(self, m):
+        """
+        Return the symbols, as a mask of bits as in masks, that may go
+        at position m of SudokuPuzzle self.
+
+        @type self: SudokuPuzzle
+        @type m: int
+        @rtype: int
+
+        >>> s = SudokuPuzzle(4, ["B"] + ["*"] * 15, {"A", "B", "C", "D"})
+        >>> s.allowed(1), s.allowed(15)
+        (13, 15)
+        """
+        return self._allowed(m)
+
+    def place(self, m, bit):
+        """
+        Return a copy of SudokuPuzzle self with the symbol bit, as in
+        masks, at empty position m, and nothing else filled in.
+
+        @type self: SudokuPuzzle
+        @type m: int
+        @type bit: int
+        @rtype: SudokuPuzzle
+
+        >>> s = SudokuPuzzle(4, ["B"] + ["*"] * 15, {"A", "B", "C", "D"})
+        >>> s.place(1, 1).symbols()[:3]
+        ['B', 'A', '*']
+        """
+        return self._child(m, bit)
+
+    def symbols(self):
+        """
+        Return the symbols of SudokuPuzzle self, row by row, with "*" for
+        empty positions.
+
+        @type self: SudokuPuzzle
+        @rtype: list[str]
+        """
+        return self._symbols
+
+    @property
+    def _symbols(self):
+        """
+        Return the symbols of SudokuPuzzle self, row by row, with "*" for
+        empty positions.
+
+        @type self: SudokuPuzzle
+        @rtype: list[str]
+
+        >>> s = SudokuPuzzle(1, ["*"], {"A"})
+        >>> s._symbols
+        ['*']
+        """
+        names = self._grid.names
+        return [names[bit] for bit in self._cells]
 
     def __eq__(self, other):
         """
@@ -52,9 +389,105 @@ class SudokuPuzzle(Puzzle):
         False
         """
         return (type(other) == type(self) and
-                self._n == other._n and self._symbols == other._symbols and
+                self._n == other._n and self._cells == other._cells and
                 self._symbol_set == other._symbol_set)
 
+    def __hash__(self):
+        """
+        Return a hash of SudokuPuzzle self.
+
+        @type self: SudokuPuzzle
+        @rtype: int
+        """
+        return hash(tuple(self._cells))
+
+    def to_bytes(self):
+        """
+        Return a compact encoding of SudokuPuzzle self: the number of each
+        position's symbol in sorted order, 0 for "*", two positions to a
+        byte when n < 16, with n and the symbols referred to by
+        fingerprint.  value_order is not encoded.
+
+        @type self: SudokuPuzzle
+        @rtype: bytes
+
+        >>> grid = ["A", "B", "C", "D"]
+        >>> grid += ["D", "C", "B", "A"]
+        >>> grid += ["*", "D", "*", "*"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+        >>> len(s.to_bytes())
+        18
+        >>> SudokuPuzzle.from_bytes(s.to_bytes()) == s
+        True
+        """
+        grid = self._grid
+        register_context(grid.fingerprint, (grid.n, grid.symbols))
+        # the number of a symbol bit is its length: 0 for 0, i + 1 for 1 << i
+        numbers = [bit.bit_length() for bit in self._cells]
+        if self._n < 16:
+            numbers.append(0)
+            numbers = [numbers[i] | numbers[i + 1] << 4
+                       for i in range(0, len(numbers) - 1, 2)]
+        return pack(_TAG, grid.fingerprint, bytes(numbers))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Return the SudokuPuzzle encoded in data by to_bytes.
+
+        @type cls: type
+        @type data: bytes
+        @rtype: SudokuPuzzle
+        """
+        (fingerprint, payload) = unpack(data, _TAG)
+        (n, symbols) = lookup_context(fingerprint)
+        if n < 16:
+            payload = [number for byte in payload
+                       for number in (byte & 15, byte >> 4)][:n * n]
+        names = ("*",) + symbols
+        return cls(n, [names[number] for number in payload], set(symbols))
+
+    def canonical_key(self):
+        """
+        Return a key shared by SudokuPuzzle self and every rotation or
+        reflection of it, with its symbols renamed in any way: all of them
+        can be completed exactly when self can.
+
+        Symbols are renamed in order of first appearance, so the key is
+        the least such renaming over the eight symmetries of the square.
+
+        @type self: SudokuPuzzle
+        @rtype: tuple[int]
+
+        >>> grid = ["A", "B", "*", "*"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> s1 = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+        >>> grid2 = ["*", "*", "*", "C"]
+        >>> grid2 += ["*", "*", "*", "D"]
+        >>> grid2 += ["*", "*", "*", "*"]
+        >>> grid2 += ["*", "*", "*", "*"]
+        >>> s2 = SudokuPuzzle(4, grid2, {"A", "B", "C", "D"})
+        >>> s1.canonical_key() == s2.canonical_key()
+        True
+        """
+        if self._n not in _transforms:
+            _transforms[self._n] = grid_transforms(self._n, self._n)
+        cells, least = self._cells, None
+        for transform in _transforms[self._n]:
+            names, image = {0: 0}, []
+            for i in transform:
+                bit = cells[i]
+                if bit not in names:
+                    names[bit] = len(names)
+                image.append(names[bit])
+            image = tuple(image)
+            if least is None or image < least:
+                least = image
+        return least
+
     def __str__(self):
         """
         Return a human-readable string representation of SudokuPuzzle self.
@@ -104,7 +537,8 @@ class SudokuPuzzle(Puzzle):
                 t.append(table[i])
             return t
 
-        rows = [row_pickets([self._symbols[r * self._n + c]
+        symbols = self._symbols
+        rows = [row_pickets([symbols[r * self._n + c]
                              for c in range(self._n)])
                 for r in range(self._n)]
         rows = table_dividers(rows)
@@ -130,19 +564,24 @@ class SudokuPuzzle(Puzzle):
         >>> s.is_solved()
         False
         """
-        # convenient names
-        n, symbols = self._n, self._symbols
-        # no "*" left and all rows, column, subsquares have correct symbols
-        return ("*" not in symbols and
-                all([(self._row_set(i) == self._symbol_set and
-                      self._column_set(i) == self._symbol_set and
-                      self._subsquare_set(i) ==
-                      self._symbol_set) for i in range(n ** 2)]))
+        # no "*" left, and so all rows, columns and subsquares, which
+        # have n positions each, use all n symbols
+        full = self._grid.full
+        return (0 not in self._cells and
+                all([mask == full for mask in self._rows]) and
+                all([mask == full for mask in self._columns]) and
+                all([mask == full for mask in self._subsquares]))
 
     def extensions(self):
         """
         Return list of extensions of SudokuPuzzle self.
 
+        Extensions fill the empty position with the fewest allowed
+        symbols, and of those the one sharing a row, column or subsquare
+        with the most empty positions.  Each extension then fills in
+        every position forced by that choice, so a contradiction it
+        leads to is caught by fail_fast.
+
         @type self: Puzzle
         @rtype: list[Puzzle]
 
@@ -160,26 +599,41 @@ class SudokuPuzzle(Puzzle):
         True
         >>> all([s in L1 for s in L2])
         True
+        >>> grid = ["A", "*", "*", "*"]
+        >>> grid += ["*", "*", "*", "C"]
+        >>> grid += ["*", "*", "*", "*"]
+        >>> grid += ["B", "*", "*", "*"]
+        >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+        >>> [e._symbols[4] for e in s.extensions()]
+        ['D']
+        >>> grid = ["A", "B", "C", "D"]
+        >>> grid += ["C", "D", "A", "B"]
+        >>> grid += ["B", "A", "*", "*"]
+        >>> grid += ["D", "C", "*", "*"]
+        >>> s = SudokuPuzzle(4, grid, {"A", "B", "C", "D"})
+        >>> [e.is_solved() for e in s.extensions()]
+        [True]
         """
-        # convenient names
-        symbols, symbol_set, n = self._symbols, self._symbol_set, self._n
-        if "*" not in symbols:
+        counts = self._counts
+        least = min(counts)
+        if least > self._n:
             # return an empty generator
             return [_ for _ in []]
         else:
-            # position of first empty position
-            i = symbols.index("*")
-            # allowed symbols at position i
-            # A | B == A.union(B)
-            allowed_symbols = (self._symbol_set -
-                               (self._row_set(i) |
-                                self._column_set(i) |
-                                self._subsquare_set(i)))
-            # list of SudokuPuzzles with each legal digit at position i
-            return (
-                [SudokuPuzzle(n,
-                 symbols[:i] + [d] + symbols[i + 1:], symbol_set)
-                 for d in allowed_symbols])
+            # most constrained empty position, ties broken by degree
+            degrees = self._degrees
+            m = max([p for p in range(len(counts)) if counts[p] == least],
+                    key=degrees.__getitem__)
+            allowed = self._allowed(m)
+            bits = [1 << i for i in range(self._n) if allowed >> i & 1]
+            if self._value_order is not None:
+                (bits_of, names) = (self._grid.bits, self._grid.names)
+                bits = [bits_of[d] for d in self._value_order(
+                    self, m, [names[bit] for bit in bits])]
+            children = [self._child(m, bit) for bit in bits]
+            for child in children:
+                child._propagate()
+            return children
 
     def fail_fast(self):
         """
@@ -198,15 +652,7 @@ class SudokuPuzzle(Puzzle):
         >>> g.fail_fast()
         False
         """
-        if "*" not in self._symbols:
-            return False
-        else:
-            for position in range(len(self._symbols)):
-                if self._symbols[position] == "*":
-                    if self._symbol_set == ((self._row_set(position) | self._column_set(position) |
-                                                     self._subsquare_set(position)) - {"*"}):
-                        return True
-            return False
+        return self._stuck or 0 in self._counts
 
     # TODO
     # override fail_fast
@@ -216,55 +662,8 @@ class SudokuPuzzle(Puzzle):
     # in the same row, column, and subsquare exhaust the symbols available,
     # there is no point in continuing.
 
-    # some helper methods
-    def _row_set(self, m):
-        #
-        # Return set of symbols in row of SudokuPuzzle self's symbols
-        # where position m occurs.
-        #
-        # @type self: SudokuPuzzle
-        # @type m: int
-        assert 0 <= m < self._n ** 2
-        # convenient names
-        n, symbols = self._n, self._symbols
-        # first position in m's row
-        r = (m // n) * n
-        # set of elements from symbols[r] .. symbols[r+n-1]
-        return set([symbols[r + i] for i in range(n)])
-
-    def _column_set(self, m):
-        # Return set of symbols in column of SudokuPuzzle self's symbols
-        # where position m occurs.
-        #
-        # @type self: SudokuPuzzle
-        # @type m: int
-        assert 0 <= m <= self._n ** 2
-        # convenient names
-        symbols, n = self._symbols, self._n
-        # first position in m's column
-        c = m % n
-        # set of elements from symbols[c], symbols[c + n],
-        # ... symbols[c + (n * (n-1))]
-        return set([symbols[c + (i * n)] for i in range(n)])
-
-    def _subsquare_set(self, m):
-        # Return set of symbols in subsquare of SudokuPuzzle self's symbols
-        # where position m occurs.
-        #
-        # @type self: Sudoku Puzzle
-        # @type m: int
-        assert 0 <= m < self._n ** 2
-        # convenient names
-        n, symbols = self._n, self._symbols
-        # row, column where m occur
-        row, col = m // n, m % n
-        # length of subsquares
-        ss = round(n ** (1 / 2))
-        # upper-left position of m's subsquare
-        ul = (((row // ss) * ss) * n) + ((col // ss) * ss)
-        # return set of symbols from subsquare starting at ul
-        return set(
-            [symbols[ul + i + n * j] for i in range(ss) for j in range(ss)])
+
+register_class(_TAG, SudokuPuzzle)
 
 
 if __name__ == "__main__":
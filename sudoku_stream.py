@@ -0,0 +1,227 @@
+"""
+Solve files of SudokuPuzzles, one per line, as a stream.
+
+Each line holds the n * n positions of a puzzle row by row, with "." or
+"*" for empty positions and the first n of _SYMBOLS, or of the symbols
+given, for the others, so a 9x9 puzzle is 81 characters over 1-9.
+Blank lines are skipped.
+
+    python sudoku_stream.py puzzles.txt solutions.txt [symbols]
+
+with "-" for standard input or output, and symbols such as
+0123456789ABCDEF for 16x16 puzzles written in hexadecimal digits,
+writes one line per puzzle, in input order: its solution, or "-" if it
+has none or could not be read.  Lines that could not be read are also
+reported, with their line numbers, on standard error.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import os
+import sys
+from time import time
+from sudoku_dlx import dlx_solutions
+from sudoku_puzzle import SudokuPuzzle
+
+# symbols of an nxn puzzle, in order
+_SYMBOLS = "123456789ABCDEFGHIJKLMNOP"
+# characters read as an empty position
+_EMPTY = ".*"
+
+
+def parse_sudoku_line(line, symbols=None):
+    """
+    Return the SudokuPuzzle written on line, with the first n of symbols
+    (_SYMBOLS by default) as the symbols of an nxn puzzle, or raise
+    ValueError saying why line does not hold one.
+
+    @type line: str
+    @type symbols: str | None
+    @rtype: SudokuPuzzle
+
+    >>> print(parse_sudoku_line("12" + "." * 14))
+    12|**
+    **|**
+    -----
+    **|**
+    **|**
+    >>> parse_sudoku_line("123")
+    Traceback (most recent call last):
+    ...
+    ValueError: 3 characters is not a square of a square
+    >>> parse_sudoku_line("1x" + "." * 14)
+    Traceback (most recent call last):
+    ...
+    ValueError: 'x' is not a symbol of a 4x4 puzzle
+    >>> hexadecimal = "0123456789ABCDEF"
+    >>> parse_sudoku_line("0F" + "." * 254, hexadecimal).symbols()[:3]
+    ['0', 'F', '*']
+    """
+    symbols = _SYMBOLS if symbols is None else symbols
+    line = line.strip()
+    n = round(len(line) ** (1 / 2))
+    r = round(n ** (1 / 2))
+    if n * n != len(line) or r * r != n or not 0 < n <= len(symbols):
+        raise ValueError("{} characters is not a square of a square".format(
+            len(line)))
+    symbols = symbols[:n]
+    grid = []
+    for c in line:
+        if c in _EMPTY:
+            grid.append("*")
+        elif c in symbols:
+            grid.append(c)
+        else:
+            raise ValueError("{!r} is not a symbol of a {}x{} puzzle".format(
+                c, n, n))
+    return SudokuPuzzle(n, grid, set(symbols))
+
+
+def _solve_chunk(first, lines, symbols=None):
+    # Solve the puzzles on lines, the first of which is line number first
+    # of the input, with symbols as in parse_sudoku_line, and return their
+    # output lines and the (line number, message) of each line that could
+    # not be read.
+    #
+    # @type first: int
+    # @type lines: list[str]
+    # @type symbols: str | None
+    # @rtype: (list[str], list[(int, str)])
+    results, errors = [], []
+    for (number, line) in enumerate(lines, first):
+        if not line.strip():
+            continue
+        try:
+            puzzle = parse_sudoku_line(line, symbols)
+        except ValueError as error:
+            results.append("-")
+            errors.append((number, str(error)))
+            continue
+        solutions = dlx_solutions(puzzle, 1)
+        if solutions:
+            results.append("".join(solutions[0].symbols()))
+        else:
+            results.append("-")
+    return results, errors
+
+
+def solve_stream(lines, out, workers=None, chunk_size=1000, errors=None,
+                 progress=None, interval=5.0, symbols=None):
+    """
+    Write to out a line for each puzzle on lines, as described above, in
+    input order, and return counts of what was done.
+
+    lines are read lazily, chunk_size at a time, and the chunks are solved
+    by workers processes (all cores by default, or in this process if
+    workers is 1).  At most two chunks per worker are held at once,
+    whether being solved or waiting for an earlier chunk to be written,
+    so memory stays bounded however long the input is.
+
+    Puzzles are read with symbols as in parse_sudoku_line.  Lines that
+    could not be read are reported to errors (standard error
+    by default), and the number of puzzles done and the puzzles per
+    second so far are written to progress, if given, every interval
+    seconds.
+
+    @type lines: iterable[str]
+    @type out: file
+    @type workers: int | None
+    @type chunk_size: int
+    @type errors: file | None
+    @type progress: file | None
+    @type interval: float
+    @type symbols: str | None
+    @rtype: dict[str, int | float]
+
+    >>> import io
+    >>> lines = ["1..4.4..2..3..21", "", "123", "1...1...........", "."]
+    >>> out, errors = io.StringIO(), io.StringIO()
+    >>> counts = solve_stream(lines, out, workers=1, chunk_size=2,
+    ...                       errors=errors)
+    >>> print(out.getvalue(), end="")
+    1234341221434321
+    -
+    -
+    1
+    >>> print(errors.getvalue(), end="")
+    line 3: 3 characters is not a square of a square
+    >>> [counts[k] for k in ("puzzles", "solved", "unsolvable", "malformed")]
+    [4, 2, 1, 1]
+    """
+    workers = workers or os.cpu_count() or 1
+    errors = sys.stderr if errors is None else errors
+    lines = iter(lines)
+    counts = {"puzzles": 0, "solved": 0, "unsolvable": 0, "malformed": 0}
+    start = last_report = time()
+    # chunks read but not yet written, oldest first: futures, or results
+    # if solved in this process
+    pending, first_line = deque(), 1
+
+    def write(chunk):
+        # Write the results of chunk to out and errors.
+        (results, chunk_errors) = chunk
+        for result in results:
+            out.write(result + "\n")
+        for (number, message) in chunk_errors:
+            errors.write("line {}: {}\n".format(number, message))
+        counts["puzzles"] += len(results)
+        counts["malformed"] += len(chunk_errors)
+        counts["solved"] += len([r for r in results if r != "-"])
+
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        exhausted = False
+        while not exhausted or pending:
+            # keep up to two chunks per worker in flight or buffered
+            while not exhausted and len(pending) < 2 * workers:
+                chunk = list(islice(lines, chunk_size))
+                if not chunk:
+                    exhausted = True
+                elif executor is None:
+                    pending.append(_solve_chunk(first_line, chunk, symbols))
+                else:
+                    pending.append(executor.submit(_solve_chunk, first_line,
+                                                   chunk, symbols))
+                first_line += len(chunk)
+            if pending:
+                # later chunks that finish first wait here for this one
+                chunk = pending.popleft()
+                write(chunk if executor is None else chunk.result())
+            if progress is not None and time() - last_report >= interval:
+                last_report = time()
+                progress.write("{} puzzles, {:.0f} puzzles/s\n".format(
+                    counts["puzzles"], counts["puzzles"] /
+                    (last_report - start)))
+                progress.flush()
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+    counts["unsolvable"] = (counts["puzzles"] - counts["solved"] -
+                            counts["malformed"])
+    counts["seconds"] = time() - start
+    return counts
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    if len(sys.argv) > 1:
+        source = open(sys.argv[1]) if sys.argv[1] != "-" else sys.stdin
+        target = (open(sys.argv[2], "w") if len(sys.argv) > 2 and
+                  sys.argv[2] != "-" else sys.stdout)
+        try:
+            counts = solve_stream(source, target, progress=sys.stderr,
+                                  symbols=(sys.argv[3] if len(sys.argv) > 3
+                                           else None))
+        finally:
+            # only close what was opened here
+            for f in (source, target):
+                if f not in (sys.stdin, sys.stdout):
+                    f.close()
+        sys.stderr.write("{} puzzles ({} solved, {} unsolvable, {} malformed)"
+                         " in {:.2f} seconds, {:.0f} puzzles/s\n".format(
+                             counts["puzzles"], counts["solved"],
+                             counts["unsolvable"], counts["malformed"],
+                             counts["seconds"],
+                             counts["puzzles"] / max(counts["seconds"],
+                                                     1e-9)))
@@ -0,0 +1,183 @@
+"""
+Interned, immutable word dictionaries shared by word-ladder puzzles.
+"""
+import weakref
+from word_graph import one_letter_adjacency, word_list_fingerprint
+
+# fingerprint -> the one live WordDictionary with that fingerprint
+_interned = weakref.WeakValueDictionary()
+
+
+class WordDictionary:
+    """
+    An immutable set of words with a precomputed fingerprint.
+
+    Build these with intern_words, so that equal word lists share one
+    WordDictionary and can be compared by identity.
+    """
+    __slots__ = ("_words", "fingerprint", "_adjacency", "__weakref__")
+
+    def __init__(self, words, fingerprint=None):
+        """
+        Create a new WordDictionary self holding words.
+
+        @type self: WordDictionary
+        @type words: iterable[str]
+        @type fingerprint: int | None
+        @rtype: None
+        """
+        self._words = frozenset(words)
+        if fingerprint is None:
+            fingerprint = word_list_fingerprint(self._words)
+        self.fingerprint = fingerprint
+        # word -> tuple of one-letter neighbours, built on first use
+        self._adjacency = None
+
+    def __eq__(self, other):
+        """
+        Return whether WordDictionary self holds the same words as other.
+
+        @type self: WordDictionary
+        @type other: WordDictionary | WordGraph | Any
+        @rtype: bool
+
+        >>> WordDictionary({"on", "no"}) == WordDictionary(["no", "on"])
+        True
+        >>> WordDictionary({"on", "no"}) == WordDictionary({"on"})
+        False
+        """
+        return self is other or (
+            self.fingerprint == getattr(other, "fingerprint", None))
+
+    def __hash__(self):
+        """
+        Return a hash of WordDictionary self.
+
+        @type self: WordDictionary
+        @rtype: int
+        """
+        return hash(self.fingerprint)
+
+    def __reduce__(self):
+        """
+        Return how to pickle WordDictionary self: as its fingerprint and
+        words, without the neighbour index, interned again when unpickled.
+
+        @type self: WordDictionary
+        @rtype: tuple
+
+        >>> import pickle
+        >>> d = intern_words({"bill", "bell", "tell"})
+        >>> d.neighbours("bell")
+        ('bill', 'tell')
+        >>> pickle.loads(pickle.dumps(d)) is d
+        True
+        """
+        return _unpickle_dictionary, (self.fingerprint, tuple(self._words))
+
+    def __contains__(self, word):
+        """
+        Return whether word is in WordDictionary self.
+
+        @type self: WordDictionary
+        @type word: str
+        @rtype: bool
+        """
+        return word in self._words
+
+    def __iter__(self):
+        """
+        Return an iterator over the words of WordDictionary self.
+
+        @type self: WordDictionary
+        @rtype: iterator[str]
+        """
+        return iter(self._words)
+
+    def __len__(self):
+        """
+        Return the number of words in WordDictionary self.
+
+        @type self: WordDictionary
+        @rtype: int
+        """
+        return len(self._words)
+
+    def neighbours(self, word):
+        """
+        Return the words of WordDictionary self that have the same length
+        as word and differ from it in exactly one position.
+
+        The neighbours of every word are computed together the first time
+        this is called, and shared by all puzzles using self.
+
+        @type self: WordDictionary
+        @type word: str
+        @rtype: tuple[str]
+
+        >>> d = WordDictionary({"bill", "bell", "tell", "tall"})
+        >>> sorted(d.neighbours("bell"))
+        ['bill', 'tell']
+        >>> d.neighbours("toll")
+        ('tall', 'tell')
+        """
+        if self._adjacency is None:
+            words, neighbours = one_letter_adjacency(self._words)
+            self._adjacency = {
+                word: tuple(words[j] for j in adjacent)
+                for word, adjacent in zip(words, neighbours)}
+        if word in self._adjacency:
+            return self._adjacency[word]
+        # word is not in the dictionary: compare it with words of its length
+        return tuple(sorted(
+            other for other in self._words if len(other) == len(word) and
+            sum(a != b for a, b in zip(word, other)) == 1))
+
+
+def intern_words(ws):
+    """
+    Return the shared dictionary for the words in ws.
+
+    ws is returned unchanged if it already is a dictionary with a
+    fingerprint, such as a WordDictionary or a WordGraph, so this is
+    cheap to call on every new puzzle state.
+
+    @type ws: set[str] | frozenset[str] | WordDictionary | WordGraph
+    @rtype: WordDictionary | WordGraph
+
+    >>> d1 = intern_words({"bill", "bell", "tell"})
+    >>> d2 = intern_words({"tell", "bell", "bill"})
+    >>> d1 is d2
+    True
+    >>> intern_words(d1) is d1
+    True
+    """
+    if hasattr(ws, "fingerprint"):
+        return ws
+    words = frozenset(ws)
+    fingerprint = word_list_fingerprint(words)
+    dictionary = _interned.get(fingerprint)
+    if dictionary is not None and dictionary._words == words:
+        return dictionary
+    dictionary = WordDictionary(words, fingerprint)
+    if fingerprint not in _interned:
+        _interned[fingerprint] = dictionary
+    return dictionary
+
+
+def _unpickle_dictionary(fingerprint, words):
+    # Return the shared dictionary of the pickled WordDictionary with
+    # fingerprint and words.
+    #
+    # @type fingerprint: int
+    # @type words: tuple[str]
+    # @rtype: WordDictionary
+    dictionary = _interned.get(fingerprint)
+    if dictionary is not None:
+        return dictionary
+    return intern_words(words)
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
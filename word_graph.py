@@ -0,0 +1,348 @@
+"""
+A compact, memory-mapped dictionary graph for word-ladder puzzles.
+
+The graph is built once, offline, from a word list:
+
+    python word_graph.py words words.graph
+
+and then opened with WordGraph("words.graph").  Opening only maps the
+file, so start-up is cheap and forked worker processes share the pages
+through the operating system's page cache.
+
+File layout (all integers are little-endian, unsigned 32-bit unless
+noted otherwise):
+
+    header        magic "WLGR", version (16-bit), max_len (16-bit),
+                  n_words, n_edges, blob_size, fingerprint (64-bit)
+    length_start  max_len + 2 entries; words of length L have the ids
+                  length_start[L] .. length_start[L + 1] - 1
+    word_offsets  n_words + 1 byte offsets of each word in blob
+    indptr        n_words + 1 offsets of each word's neighbours in indices
+    indices       n_edges word ids (CSR adjacency, sorted per word)
+    blob          utf-8 encoded words, partitioned by length and sorted
+                  within each partition
+"""
+from array import array
+import hashlib
+import mmap
+import os
+import struct
+import sys
+
+_MAGIC = b"WLGR"
+_VERSION = 1
+_HEADER = struct.Struct("<4sHHIIIQ")
+
+
+def word_list_fingerprint(words):
+    """
+    Return a 64-bit fingerprint of the collection of words, which does
+    not depend on the order or duplication of words.
+
+    @type words: iterable[str]
+    @rtype: int
+
+    >>> word_list_fingerprint(["on", "no"]) == word_list_fingerprint({"no", "on"})
+    True
+    >>> word_list_fingerprint(["on"]) == word_list_fingerprint(["no"])
+    False
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for word in sorted(set(words)):
+        digest.update(word.encode("utf-8"))
+        digest.update(b"\n")
+    return int.from_bytes(digest.digest(), "little")
+
+
+def _uint32_array(values):
+    # Return values as a little-endian array of unsigned 32-bit ints.
+    #
+    # @type values: iterable[int]
+    # @rtype: array
+    result = array("I", values)
+    assert result.itemsize == 4
+    if sys.byteorder != "little":
+        result.byteswap()
+    return result
+
+
+def one_letter_adjacency(words):
+    """
+    Return the words sorted by length and then alphabetically, and for
+    each of them the sorted indices of the words that have the same
+    length and differ in exactly one position.
+
+    @type words: iterable[str]
+    @rtype: (list[str], list[list[int]])
+
+    >>> one_letter_adjacency({"bell", "tell", "tall", "seal"})
+    (['bell', 'seal', 'tall', 'tell'], [[3], [], [3], [0, 2]])
+    """
+    words = sorted(set(words), key=lambda w: (len(w), w))
+    neighbours = [[] for _ in words]
+    start = 0
+    while start < len(words):
+        length = len(words[start])
+        end = start
+        while end < len(words) and len(words[end]) == length:
+            end += 1
+        # bucket words by the pattern left after deleting one position;
+        # words sharing a bucket differ in exactly that position
+        for position in range(length):
+            buckets = {}
+            for i in range(start, end):
+                word = words[i]
+                key = word[:position] + word[position + 1:]
+                buckets.setdefault(key, []).append(i)
+            for bucket in buckets.values():
+                if len(bucket) > 1:
+                    for i in bucket:
+                        neighbours[i].extend(j for j in bucket if j != i)
+        start = end
+    for adjacent in neighbours:
+        adjacent.sort()
+    return words, neighbours
+
+
+def build_word_graph(words, path):
+    """
+    Write the one-letter-change graph over words to the file at path.
+
+    Two words are neighbours when they have the same length and differ
+    in exactly one position, just like WordLadderPuzzle.extensions.
+
+    @type words: iterable[str]
+    @type path: str
+    @rtype: None
+    """
+    words, neighbours = one_letter_adjacency(words)
+    max_len = len(words[-1]) if words else 0
+    # length_start[L] is the first id of a word of length L
+    length_start = [0] * (max_len + 2)
+    for word in words:
+        length_start[len(word) + 1] += 1
+    for length in range(1, max_len + 2):
+        length_start[length] += length_start[length - 1]
+    indptr, indices = [0], []
+    for adjacent in neighbours:
+        indices.extend(adjacent)
+        indptr.append(len(indices))
+    encoded = [word.encode("utf-8") for word in words]
+    offsets = [0]
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    blob = b"".join(encoded)
+    header = _HEADER.pack(_MAGIC, _VERSION, max_len, len(words),
+                          len(indices), len(blob),
+                          word_list_fingerprint(words))
+    with open(path, "wb") as out:
+        out.write(header)
+        for section in (length_start, offsets, indptr, indices):
+            _uint32_array(section).tofile(out)
+        out.write(blob)
+
+
+class WordGraph:
+    """
+    A read-only, memory-mapped word list with precomputed one-letter
+    neighbours, usable as the word set of a WordLadderPuzzle.
+    """
+
+    def __init__(self, path):
+        """
+        Open the word graph stored at path by build_word_graph.
+
+        @type self: WordGraph
+        @type path: str
+        @rtype: None
+        """
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self._max_len, self._n_words, n_edges, blob_size,
+         self.fingerprint) = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self._map.close()
+            raise ValueError("{} is not a version {} word graph".format(
+                path, _VERSION))
+        self.path = path
+        start = _HEADER.size
+        (self._length_start, start) = self._section(start, self._max_len + 2)
+        (self._offsets, start) = self._section(start, self._n_words + 1)
+        (self._indptr, start) = self._section(start, self._n_words + 1)
+        (self._indices, start) = self._section(start, n_edges)
+        self._blob = memoryview(self._map)[start:start + blob_size]
+
+    def _section(self, start, count):
+        # Return a view of count uint32 values at byte offset start of
+        # the mapped file, and the byte offset just past them.
+        #
+        # @type self: WordGraph
+        # @type start: int
+        # @type count: int
+        # @rtype: (memoryview | array, int)
+        end = start + 4 * count
+        view = memoryview(self._map)[start:end].cast("I")
+        if sys.byteorder != "little":
+            view = array("I", view)
+            view.byteswap()
+        return view, end
+
+    def __eq__(self, other):
+        """
+        Return whether WordGraph self holds the same words as other.
+
+        @type self: WordGraph
+        @type other: WordGraph | WordDictionary | Any
+        @rtype: bool
+        """
+        return self is other or (
+            self.fingerprint == getattr(other, "fingerprint", None))
+
+    def __hash__(self):
+        """
+        Return a hash of WordGraph self.
+
+        @type self: WordGraph
+        @rtype: int
+        """
+        return hash(self.fingerprint)
+
+    def __reduce__(self):
+        """
+        Return how to pickle WordGraph self: as its path, which is mapped
+        again when unpickled, so worker processes share the file.
+
+        @type self: WordGraph
+        @rtype: tuple
+
+        >>> import pickle, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "test.graph")
+        >>> build_word_graph({"bell", "tell", "tall"}, path)
+        >>> g = WordGraph(path)
+        >>> copy = pickle.loads(pickle.dumps(g))
+        >>> copy == g, copy.neighbours("tell"), len(pickle.dumps(g)) < 200
+        (True, ['bell', 'tall'], True)
+        >>> copy.close(); g.close()
+        """
+        return WordGraph, (os.path.abspath(self.path),)
+
+    def __len__(self):
+        """
+        Return the number of words in WordGraph self.
+
+        @type self: WordGraph
+        @rtype: int
+        """
+        return self._n_words
+
+    def __iter__(self):
+        """
+        Yield the words of WordGraph self, shortest first.
+
+        @type self: WordGraph
+        @rtype: generator[str]
+        """
+        for i in range(self._n_words):
+            yield self.word(i)
+
+    def __contains__(self, word):
+        """
+        Return whether word is in WordGraph self.
+
+        @type self: WordGraph
+        @type word: str
+        @rtype: bool
+        """
+        return self.word_id(word) is not None
+
+    def word(self, i):
+        """
+        Return the word with id i.
+
+        @type self: WordGraph
+        @type i: int
+        @rtype: str
+        """
+        return str(self._blob[self._offsets[i]:self._offsets[i + 1]],
+                   "utf-8")
+
+    def word_id(self, word):
+        """
+        Return the id of word, or None if word is not in WordGraph self.
+
+        @type self: WordGraph
+        @type word: str
+        @rtype: int | None
+        """
+        if not isinstance(word, str) or len(word) > self._max_len:
+            return None
+        # binary search within the partition of words of this length
+        low = self._length_start[len(word)]
+        high = self._length_start[len(word) + 1]
+        while low < high:
+            middle = (low + high) // 2
+            if self.word(middle) < word:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._length_start[len(word) + 1] and self.word(low) == word:
+            return low
+        return None
+
+    def neighbour_ids(self, i):
+        """
+        Return the ids of the words one letter away from the word with id i.
+
+        @type self: WordGraph
+        @type i: int
+        @rtype: memoryview | array
+        """
+        return self._indices[self._indptr[i]:self._indptr[i + 1]]
+
+    def neighbours(self, word):
+        """
+        Return the words of WordGraph self that have the same length as
+        word and differ from it in exactly one position.
+
+        @type self: WordGraph
+        @type word: str
+        @rtype: list[str]
+        """
+        i = self.word_id(word)
+        if i is not None:
+            return [self.word(j) for j in self.neighbour_ids(i)]
+        # word is not in the graph: scan the words of its length
+        result = []
+        if len(word) <= self._max_len:
+            for j in range(self._length_start[len(word)],
+                           self._length_start[len(word) + 1]):
+                other = self.word(j)
+                if sum(a != b for a, b in zip(word, other)) == 1:
+                    result.append(other)
+        return result
+
+    def close(self):
+        """
+        Release the memory map of WordGraph self.
+
+        @type self: WordGraph
+        @rtype: None
+        """
+        self._length_start = self._offsets = self._indptr = None
+        self._indices = self._blob = None
+        self._map.close()
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    from time import time
+    source = sys.argv[1] if len(sys.argv) > 1 else "words"
+    target = sys.argv[2] if len(sys.argv) > 2 else "words.graph"
+    start = time()
+    with open(source, "r") as words:
+        build_word_graph(words.read().split(), target)
+    end = time()
+    graph = WordGraph(target)
+    print("Built {} with {} words in {} seconds.".format(
+        target, len(graph), end - start))
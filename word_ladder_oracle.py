@@ -0,0 +1,257 @@
+"""
+Answer many word-ladder queries against one dictionary.
+"""
+from collections import OrderedDict, deque
+from puzzle_tools import create_puzzlenode, PuzzleNode
+from word_dictionary import intern_words
+from word_ladder_puzzle import WordLadderPuzzle
+
+
+class WordLadderOracle:
+    """
+    Shortest word ladders over a fixed dictionary, reusing work between
+    queries.
+
+    Connected components of the dictionary are computed up front, so
+    queries between disconnected words are rejected in O(1).  Breadth
+    first search trees are cached with least-recently-used eviction, and
+    since ladders can be walked both ways a cached tree rooted at either
+    end of a query answers it.
+    """
+
+    def __init__(self, ws, cache_size=64):
+        """
+        Create a new WordLadderOracle self over the words in ws, keeping
+        at most cache_size search trees.
+
+        @type self: WordLadderOracle
+        @type ws: set[str] | WordDictionary | WordGraph
+        @type cache_size: int
+        @rtype: None
+        """
+        assert cache_size > 0
+        self._word_set, self._cache_size = intern_words(ws), cache_size
+        # root word -> {word: next word on a shortest path to root}
+        self._trees = OrderedDict()
+        self._component = {}
+        for word in self._word_set:
+            if word not in self._component:
+                self._component[word] = word
+                for other in self._search(word):
+                    self._component[other] = word
+
+    def _search(self, root):
+        # Return a dict mapping each word reachable from root to the word
+        # after it on a shortest ladder to root, with root mapped to None.
+        #
+        # @type self: WordLadderOracle
+        # @type root: str
+        # @rtype: dict[str, str | None]
+        tree, q = {root: None}, deque([root])
+        while q:
+            word = q.popleft()
+            for other in self._word_set.neighbours(word):
+                if other not in tree:
+                    tree[other] = word
+                    q.append(other)
+        return tree
+
+    def _tree(self, root):
+        # Return the cached search tree rooted at root, building it if
+        # needed and evicting the least recently used tree.
+        #
+        # @type self: WordLadderOracle
+        # @type root: str
+        # @rtype: dict[str, str | None]
+        if root in self._trees:
+            self._trees.move_to_end(root)
+        else:
+            self._trees[root] = self._search(root)
+            if len(self._trees) > self._cache_size:
+                self._trees.popitem(last=False)
+        return self._trees[root]
+
+    def connected(self, from_word, to_word):
+        """
+        Return whether some word ladder leads from from_word to to_word.
+
+        @type self: WordLadderOracle
+        @type from_word: str
+        @type to_word: str
+        @rtype: bool
+
+        >>> o = WordLadderOracle({"bill", "bell", "tell", "tall", "seal"})
+        >>> o.connected("bill", "tall")
+        True
+        >>> o.connected("bill", "seal")
+        False
+        >>> o.connected("toll", "bill")
+        True
+        """
+        if to_word not in self._component:
+            return False
+        if from_word in self._component:
+            return self._component[from_word] == self._component[to_word]
+        # a start word outside the dictionary can still step into it
+        return any(self._component[other] == self._component[to_word]
+                   for other in self._word_set.neighbours(from_word))
+
+    def ladder(self, from_word, to_word):
+        """
+        Return the words of a shortest ladder from from_word to to_word,
+        or None if there is none.
+
+        @type self: WordLadderOracle
+        @type from_word: str
+        @type to_word: str
+        @rtype: list[str] | None
+
+        >>> o = WordLadderOracle({"bill", "bell", "tell", "tall", "seal"})
+        >>> o.ladder("bill", "tall")
+        ['bill', 'bell', 'tell', 'tall']
+        >>> o.ladder("tall", "bill")
+        ['tall', 'tell', 'bell', 'bill']
+        >>> o.ladder("bill", "seal") is None
+        True
+        """
+        if not self.connected(from_word, to_word):
+            return None
+        if from_word in self._trees or (from_word in self._component and
+                                        to_word not in self._trees):
+            # walk down the tree rooted at from_word and reverse
+            tree = self._tree(from_word)
+            path = [to_word]
+            while tree[path[-1]] is not None:
+                path.append(tree[path[-1]])
+            return path[::-1]
+        tree = self._tree(to_word)
+        path = [from_word]
+        if from_word not in tree:
+            path.append(min(self._word_set.neighbours(from_word),
+                            key=lambda w: self._depth(tree, w)
+                            if w in tree else len(tree)))
+        while tree[path[-1]] is not None:
+            path.append(tree[path[-1]])
+        return path
+
+    @staticmethod
+    def _depth(tree, word):
+        # Return the number of steps from word to the root of tree.
+        #
+        # @type tree: dict[str, str | None]
+        # @type word: str
+        # @rtype: int
+        depth = 0
+        while tree[word] is not None:
+            word, depth = tree[word], depth + 1
+        return depth
+
+    def distance(self, from_word, to_word):
+        """
+        Return the number of steps in a shortest ladder from from_word to
+        to_word, or None if there is none.
+
+        @type self: WordLadderOracle
+        @type from_word: str
+        @type to_word: str
+        @rtype: int | None
+
+        >>> o = WordLadderOracle({"bill", "bell", "tell", "tall", "seal"})
+        >>> o.distance("bill", "tall")
+        3
+        >>> o.distance("seal", "seal")
+        0
+        """
+        path = self.ladder(from_word, to_word)
+        return None if path is None else len(path) - 1
+
+    def solve(self, from_word, to_word):
+        """
+        Return a path of PuzzleNodes from the WordLadderPuzzle from_word
+        to to_word to a solved one, in the format of breadth_first_solve,
+        or None if this is not possible.
+
+        @type self: WordLadderOracle
+        @type from_word: str
+        @type to_word: str
+        @rtype: PuzzleNode | None
+
+        >>> o = WordLadderOracle({"bill", "bell", "tell"})
+        >>> node = o.solve("bill", "tell")
+        >>> while node.children:
+        ...     print(node.puzzle)
+        ...     node = node.children[0]
+        bill -> tell
+        bell -> tell
+        >>> node.puzzle.is_solved()
+        True
+        """
+        path = self.ladder(from_word, to_word)
+        if path is None:
+            return None
+        node = PuzzleNode(WordLadderPuzzle(path[-1], to_word, self._word_set))
+        for word in reversed(path[:-1]):
+            node = create_puzzlenode(
+                WordLadderPuzzle(word, to_word, self._word_set), node)
+        return node
+
+    def solve_all(self, pairs):
+        """
+        Return the solutions, as from solve, of each (from_word, to_word)
+        query in pairs, in the same order.
+
+        Queries are grouped by shared end words, so that each search tree
+        is built once for the whole batch.
+
+        @type self: WordLadderOracle
+        @type pairs: list[(str, str)]
+        @rtype: list[PuzzleNode | None]
+
+        >>> o = WordLadderOracle({"bill", "bell", "tell", "tall", "seal"})
+        >>> [None if s is None else str(s.puzzle)
+        ...  for s in o.solve_all([("bill", "tall"), ("seal", "tall")])]
+        ['bill -> tall', None]
+        """
+        pairs = list(pairs)
+        uses = {}
+        for (from_word, to_word) in pairs:
+            if self.connected(from_word, to_word):
+                for word in (from_word, to_word):
+                    uses[word] = uses.get(word, 0) + 1
+        # answer the queries sharing the most popular end word together
+        order = sorted(range(len(pairs)), key=lambda i: -max(
+            uses.get(pairs[i][0], 0) if pairs[i][0] in self._component
+            else 0, uses.get(pairs[i][1], 0)))
+        results = [None] * len(pairs)
+        for i in order:
+            (from_word, to_word) = pairs[i]
+            if (from_word in self._component and from_word not in self._trees
+                    and to_word not in self._trees and
+                    uses.get(to_word, 0) > uses.get(from_word, 0)):
+                # prefer building the tree that more queries can share
+                self._tree(to_word)
+            results[i] = self.solve(from_word, to_word)
+        return results
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    from time import time
+    with open("words", "r") as words:
+        word_set = set(words.read().split())
+    start = time()
+    oracle = WordLadderOracle(word_set)
+    end = time()
+    print("Found components of {} words in {} seconds.".format(
+        len(word_set), end - start))
+    queries = [("same", "cost"), ("cold", "cost"), ("same", "warm"),
+               ("head", "tail"), ("cost", "head")]
+    start = time()
+    solutions = oracle.solve_all(queries)
+    end = time()
+    for (query, solution) in zip(queries, solutions):
+        print("{} -> {}: {}".format(query[0], query[1], oracle.distance(
+            *query)))
+    print("Answered {} queries in {} seconds.".format(
+        len(queries), end - start))
@@ -1,4 +1,10 @@
 from puzzle import Puzzle
+from puzzle_codec import (lookup_context, pack, register_class,
+                          register_context, unpack)
+from word_dictionary import intern_words
+
+# puzzle_codec tag of WordLadderPuzzle states
+_TAG = 1
 
 
 class WordLadderPuzzle(Puzzle):
@@ -12,13 +18,17 @@ class WordLadderPuzzle(Puzzle):
         from from_word to to_word using words in ws, changing one
         character at each step.
 
+        Equal word sets are shared through one interned dictionary, so
+        every state only holds a reference to it.
+
         @type from_word: str
         @type to_word: str
-        @type ws: set[str]
+        @type ws: set[str] | WordDictionary | WordGraph
         @rtype: None
         """
         (self._from_word, self._to_word, self._word_set) = (from_word,
-                                                            to_word, ws)
+                                                            to_word,
+                                                            intern_words(ws))
         # set of characters to use for 1-character changes
         self._chars = "abcdefghijklmnopqrstuvwxyz"
 
@@ -39,11 +49,76 @@ class WordLadderPuzzle(Puzzle):
         >>> w3 = WordLadderPuzzle("bell", "tell", word_set)
         >>> w1 == w3
         False
+        >>> w1._word_set is w2._word_set
+        True
         """
+        # interned dictionaries compare by identity or fingerprint
         return type(self) == type(other) and (self._from_word, self._to_word, self._word_set) == (other._from_word,
                                                                                                   other._to_word,
                                                                                                   other._word_set)
 
+    def __hash__(self):
+        """
+        Return a hash of WordLadderPuzzle self.
+
+        @type self: WordLadderPuzzle
+        @rtype: int
+
+        >>> w1 = WordLadderPuzzle("bill", "tell", {"bill", "bell", "tell"})
+        >>> w2 = WordLadderPuzzle("bill", "tell", {"tell", "bell", "bill"})
+        >>> hash(w1) == hash(w2)
+        True
+        """
+        return hash((self._from_word, self._to_word,
+                     self._word_set.fingerprint))
+
+    def to_bytes(self):
+        """
+        Return a compact encoding of WordLadderPuzzle self: its two words,
+        with its word set referred to by fingerprint.
+
+        @type self: WordLadderPuzzle
+        @rtype: bytes
+
+        >>> w = WordLadderPuzzle("bill", "tell", {"bill", "bell", "tell"})
+        >>> len(w.to_bytes())
+        19
+        >>> WordLadderPuzzle.from_bytes(w.to_bytes()) == w
+        True
+        """
+        fingerprint = self._word_set.fingerprint
+        register_context(fingerprint, self._word_set)
+        return pack(_TAG, fingerprint, "{}\n{}".format(
+            self._from_word, self._to_word).encode("utf-8"))
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Return the WordLadderPuzzle encoded in data by to_bytes.
+
+        @type cls: type
+        @type data: bytes
+        @rtype: WordLadderPuzzle
+        """
+        (fingerprint, payload) = unpack(data, _TAG)
+        (from_word, to_word) = payload.decode("utf-8").split("\n")
+        return cls(from_word, to_word, lookup_context(fingerprint))
+
+    def heuristic(self):
+        """
+        Return the number of letters of the from word of WordLadderPuzzle
+        self that differ from its to word: each step changes one.
+
+        @type self: WordLadderPuzzle
+        @rtype: int
+
+        >>> WordLadderPuzzle("bill", "tall", {"bill", "tall"}).heuristic()
+        2
+        """
+        return len([1 for (a, b) in zip(self._from_word, self._to_word)
+                    if a != b]) + abs(len(self._from_word) -
+                                      len(self._to_word))
+
     def __str__(self):
         """
         Return a string representation of WordLadderPuzzle self.
@@ -71,16 +146,9 @@ class WordLadderPuzzle(Puzzle):
         >>> w2 = WordLadderPuzzle("tell", "tall", word_set)
         >>> ex[0] = w2
         """
-        return_list = []
-        for word in self._word_set:
-            if len(word) == len(self._from_word):
-                counter = 0
-                for char in range(len(self._from_word)):
-                    if self._from_word[char] != word[char]:
-                        counter += 1
-                if counter == 1:
-                    return_list.append(WordLadderPuzzle(word, self._to_word, self._word_set))
-        return return_list
+        # the shared dictionary knows the one-letter neighbours of each word
+        return [WordLadderPuzzle(word, self._to_word, self._word_set)
+                for word in self._word_set.neighbours(self._from_word)]
 
     def is_solved(self):
         """
@@ -107,13 +175,22 @@ class WordLadderPuzzle(Puzzle):
         # _to_word
 
 
+register_class(_TAG, WordLadderPuzzle)
+
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
     from puzzle_tools import breadth_first_solve, depth_first_solve
     from time import time
-    with open("words", "r") as words:
-        word_set = set(words.read().split())
+    import os
+    if os.path.exists("words.graph"):
+        # built offline with: python word_graph.py words words.graph
+        from word_graph import WordGraph
+        word_set = WordGraph("words.graph")
+    else:
+        with open("words", "r") as words:
+            word_set = set(words.read().split())
     w = WordLadderPuzzle("same", "cost", word_set)
     start = time()
     sol = breadth_first_solve(w)